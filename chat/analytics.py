@@ -0,0 +1,236 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+
+INITIAL_CAPACITY = 4096
+SCORE_BINS = np.arange(0, 101, 10)
+PERCENTILES = (10, 25, 50, 75, 90)
+TREND_BUCKETS = {'day': 86400, 'week': 7 * 86400}
+QUESTION_SLOTS = 1 << 15  # Question ids per exam; a question's key is exam code * slots + id
+
+# One row per graded answer; strings are dictionary-encoded into int32 codes
+# once per user, exam and topic, so rows hold only numbers
+COLUMNS = (
+    ('user', np.int32),
+    ('exam', np.int32),
+    ('question', np.int16),     # question_id within the exam
+    ('topic', np.int32),
+    ('correct', np.bool_),
+    ('timestamp', np.float64),  # graded_at as epoch seconds
+    ('active', np.bool_),       # False once an exam is regraded
+)
+
+def to_timestamp(value):
+    """Convert an ISO datetime string to epoch seconds"""
+    return datetime.fromisoformat(value).timestamp()
+
+class _Codes:
+    """Dictionary encoder mapping strings to dense integer codes"""
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, values):
+        """Codes of the known values among ``values``"""
+        return np.array([self.index[v] for v in values if v in self.index], dtype=np.int32)
+
+class AnswerStore:
+    """Append-only, column-oriented store of graded exam answers.
+
+    Columns are NumPy arrays grown by doubling, so appends are amortised
+    O(1) and every query is a handful of vectorized passes (masks,
+    bincount, percentile) over the filled prefix.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self._lock = threading.Lock()
+        self._size = 0
+        self._columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS}
+        self.users = _Codes()
+        self.exams = _Codes()
+        self.topics = _Codes()
+        self._exam_rows = {}      # exam code: (start, stop) of its active rows
+        self._graded_at = {}      # exam code: timestamp of the grading its rows hold
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, extra):
+        capacity = len(self._columns['user'])
+        needed = self._size + extra
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def append_exam(self, user_id, exam_id, topic, detailed_results, graded_at):
+        """Add the answers of a graded exam, superseding an earlier grading of it.
+
+        Gradings no newer than the one already held are ignored, so the same
+        exam can arrive more than once and in any order.
+        """
+        count = len(detailed_results)
+        timestamp = to_timestamp(graded_at)
+        with self._lock:
+            exam_code = self.exams.encode(exam_id)
+            if self._graded_at.get(exam_code, float('-inf')) >= timestamp:
+                return
+            self._graded_at[exam_code] = timestamp
+            previous = self._exam_rows.get(exam_code)
+            if previous:
+                self._columns['active'][previous[0]:previous[1]] = False
+            if not count:
+                self._exam_rows.pop(exam_code, None)
+                return
+
+            question_ids = [int(result['question_id']) for result in detailed_results]
+            if not all(0 <= q < QUESTION_SLOTS for q in question_ids):
+                raise ValueError(f"question_id must be between 0 and {QUESTION_SLOTS - 1}")
+
+            self._reserve(count)
+            start, stop = self._size, self._size + count
+            cols = self._columns
+            cols['user'][start:stop] = self.users.encode(user_id)
+            cols['exam'][start:stop] = exam_code
+            cols['question'][start:stop] = question_ids
+            cols['topic'][start:stop] = self.topics.encode(topic)
+            cols['correct'][start:stop] = [bool(r['is_correct']) for r in detailed_results]
+            cols['timestamp'][start:stop] = timestamp
+            cols['active'][start:stop] = True
+
+            self._exam_rows[exam_code] = (start, stop)
+            self._size = stop
+
+    def _select(self, user_ids=None, topic=None, since=None, until=None):
+        """Column views of the active rows matching the filters"""
+        with self._lock:
+            size = self._size
+            cols = {name: column[:size] for name, column in self._columns.items()}
+            user_codes = self.users.lookup(user_ids) if user_ids else None
+            topic_code = self.topics.index.get(topic, -1) if topic else None
+
+        mask = cols['active'].copy()
+        if user_codes is not None:
+            mask &= np.isin(cols['user'], user_codes)
+        if topic_code is not None:
+            mask &= cols['topic'] == topic_code
+        if since is not None:
+            mask &= cols['timestamp'] >= since
+        if until is not None:
+            mask &= cols['timestamp'] < until
+        if mask.all():
+            # Nothing filtered out: hand back the views without copying
+            return {name: column for name, column in cols.items() if name != 'active'}
+        return {name: column[mask] for name, column in cols.items() if name != 'active'}
+
+    def _exam_scores(self, rows):
+        """Exam codes present in ``rows`` and their percentage scores"""
+        counts = np.bincount(rows['exam'], minlength=len(self.exams))
+        correct = np.bincount(rows['exam'], weights=rows['correct'], minlength=len(self.exams))
+        present = np.flatnonzero(counts)
+        return present, correct[present] / counts[present] * 100
+
+    def topic_summary(self, **filters):
+        """Answer counts, accuracy and average exam score per topic"""
+        rows = self._select(**filters)
+        num_topics = len(self.topics)
+        answers = np.bincount(rows['topic'], minlength=num_topics)
+        correct = np.bincount(rows['topic'], weights=rows['correct'], minlength=num_topics)
+
+        # Every exam belongs to a single topic, so scores can be grouped by it
+        exam_codes, scores = self._exam_scores(rows)
+        exam_topic = np.zeros(len(self.exams), dtype=np.int32)
+        exam_topic[rows['exam']] = rows['topic']
+        exams = np.bincount(exam_topic[exam_codes], minlength=num_topics)
+        score_totals = np.bincount(exam_topic[exam_codes], weights=scores, minlength=num_topics)
+
+        return [{
+            "topic": self.topics.values[code],
+            "answers": int(answers[code]),
+            "accuracy": round(float(correct[code] / answers[code]) * 100, 2),
+            "exams": int(exams[code]),
+            "average_score": round(float(score_totals[code] / exams[code]), 2)
+        } for code in np.flatnonzero(answers)]
+
+    def hardest_questions(self, limit=10, min_attempts=1, **filters):
+        """Questions with the lowest accuracy among those answered often enough.
+
+        Entries name the question by exam_id and question_id; the caller
+        looks up the text.
+        """
+        rows = self._select(**filters)
+        keys = rows['exam'].astype(np.int64) * QUESTION_SLOTS + rows['question']
+        # Keys are sparse, so count over their dense ranks rather than the keys
+        questions, ranks = np.unique(keys, return_inverse=True)
+        attempts = np.bincount(ranks, minlength=len(questions))
+        correct = np.bincount(ranks, weights=rows['correct'], minlength=len(questions))
+
+        candidates = np.flatnonzero(attempts >= max(min_attempts, 1))
+        accuracy = correct[candidates] / attempts[candidates]
+        if len(candidates) > limit:
+            # Partial selection avoids sorting every question
+            lowest = np.argpartition(accuracy, limit)[:limit]
+            candidates, accuracy = candidates[lowest], accuracy[lowest]
+        order = candidates[np.argsort(accuracy, kind='stable')]
+        hardest = []
+        for rank in order:
+            exam_code, question_id = divmod(int(questions[rank]), QUESTION_SLOTS)
+            exam_id = self.exams.values[exam_code]
+            hardest.append({
+                "question_key": f"{exam_id}:{question_id}",
+                "exam_id": exam_id,
+                "question_id": question_id,
+                "attempts": int(attempts[rank]),
+                "accuracy": round(float(correct[rank] / attempts[rank]) * 100, 2)
+            })
+        return hardest
+
+    def score_distribution(self, **filters):
+        """Percentiles and a 10-point histogram of exam scores"""
+        _, scores = self._exam_scores(self._select(**filters))
+        histogram, edges = np.histogram(scores, bins=SCORE_BINS)
+        return {
+            "exams": int(len(scores)),
+            "mean": round(float(scores.mean()), 2) if len(scores) else None,
+            "percentiles": {
+                f"p{p}": round(float(v), 2)
+                for p, v in zip(PERCENTILES, np.percentile(scores, PERCENTILES))
+            } if len(scores) else {},
+            "histogram": [
+                {"from": int(lo), "to": int(hi), "count": int(count)}
+                for lo, hi, count in zip(edges[:-1], edges[1:], histogram)
+            ]
+        }
+
+    def trend(self, bucket='day', **filters):
+        """Accuracy and answer volume per day or week"""
+        rows = self._select(**filters)
+        if not len(rows['timestamp']):
+            return []
+        width = TREND_BUCKETS[bucket]
+        periods = (rows['timestamp'] // width).astype(np.int64)
+        first = periods.min()
+        offsets = periods - first
+        answers = np.bincount(offsets)
+        correct = np.bincount(offsets, weights=rows['correct'])
+        return [{
+            "period_start": datetime.fromtimestamp(float((first + offset) * width)).isoformat(),
+            "answers": int(answers[offset]),
+            "accuracy": round(float(correct[offset] / answers[offset]) * 100, 2)
+        } for offset in np.flatnonzero(answers)]
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        # Off by default so manage.py commands stay fast and key-free;
+        # enable on web workers to build the Gemini client during boot
+        if getattr(settings, 'GEMINI_PREWARM_CLIENT', False):
+            from .llm import prewarm_client
+            prewarm_client()
@@ -0,0 +1,83 @@
+import json
+from datetime import datetime, timedelta
+from itertools import islice
+
+EXPORT_TYPES = ('sessions', 'exams')
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024  # Lines are grouped so each write isn't a single record
+# A record's updated_at is stamped before the request that changed it
+# commits, so the cursor handed out is moved back by the longest a request
+# may take. Records in the overlap are exported twice; importing is keyed
+# by id, so the repeat overwrites rather than duplicates.
+EXPORT_CURSOR_OVERLAP = timedelta(minutes=5)
+
+def iter_ndjson(records, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """Encode records as NDJSON, yielding byte chunks of roughly ``chunk_bytes``"""
+    buffer = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, separators=(',', ':'), default=str).encode() + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+# Fields the importer and later exports rely on, per record type
+REQUIRED_FIELDS = {
+    'session': ('session_id', 'user_id', 'topic', 'conversation_history', 'learning_objectives',
+                'concepts_covered', 'difficulty_level', 'status', 'created_at', 'updated_at'),
+    'exam': ('exam_data', 'score', 'graded_at', 'updated_at'),
+}
+REQUIRED_EXAM_DATA = ('session_id', 'topic', 'questions')
+
+def validate_record(record):
+    """Check an imported record has what storing it needs; raises ValueError"""
+    if not isinstance(record, dict) or record.get('type') not in REQUIRED_FIELDS:
+        raise ValueError("expected an object with type 'session' or 'exam'")
+    data = record.get('data')
+    if not isinstance(record.get('id'), str) or not isinstance(data, dict):
+        raise ValueError("expected a string id and an object data")
+    missing = [field for field in REQUIRED_FIELDS[record['type']] if field not in data]
+    if record['type'] == 'exam' and isinstance(data.get('exam_data'), dict):
+        missing += [f"exam_data.{field}" for field in REQUIRED_EXAM_DATA if field not in data['exam_data']]
+    if missing:
+        raise ValueError(f"{record['type']} {record['id']} is missing {', '.join(missing)}")
+    if record['type'] == 'session' and data['session_id'] != record['id']:
+        raise ValueError(f"session {record['id']} has a different session_id")
+    if record['type'] == 'exam' and data['score'] is not None and not data['graded_at']:
+        raise ValueError(f"exam {record['id']} has a score but no graded_at")
+    for field in ('created_at', 'updated_at', 'graded_at'):
+        if data.get(field) is not None:
+            try:
+                datetime.fromisoformat(data[field])
+            except (TypeError, ValueError):
+                raise ValueError(f"{record['type']} {record['id']} has an invalid {field}")
+
+def export_cursor():
+    """The ``since`` value for the export that follows one starting now"""
+    return (datetime.now() - EXPORT_CURSOR_OVERLAP).isoformat()
+
+def read_ndjson(lines):
+    """Parse NDJSON from any iterable of lines (file, request stream), skipping blanks"""
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {number}: {e.msg}")
+
+def batched(iterable, size):
+    """Group an iterable into lists of at most ``size`` items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,212 @@
+import re
+import random
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+
+# MinHash parameters: 16 bands x 4 rows puts the LSH candidate threshold
+# around Jaccard 0.5, candidates are then confirmed against SIMILARITY_THRESHOLD
+NUM_PERM = 64
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+SIMILARITY_THRESHOLD = 0.7
+MAX_INDEXED_QUESTIONS = 100000   # ~50 MB per process; least recently used users are evicted past this
+MAX_QUESTIONS_PER_SCOPE = 5000   # A user's oldest questions are dropped past this
+
+# Universal hash (a * h + b) mod p over 32-bit shingle hashes. With a, b and
+# h all below 2**32, a * h + b stays below 2**64, so it is computed exactly
+# in uint64 arrays
+_PRIME = (1 << 32) - 5
+_rng = random.Random(1729)  # Fixed seed so signatures are stable across processes
+_PERMUTATIONS = [
+    (_rng.randint(1, _PRIME - 1), _rng.randint(0, _PRIME - 1))
+    for _ in range(NUM_PERM)
+]
+_hash_arrays = None  # (a, b) as uint64 arrays, built with the first signature
+
+_OPTION_PREFIX = re.compile(r"^\s*[A-Za-z][\).:]\s*")
+_WORD = re.compile(r"\w+")
+
+def question_shingles(question):
+    """Build the set of hashed word bigrams for a question and its options"""
+    options = [_OPTION_PREFIX.sub("", str(opt)) for opt in question.get('options', [])]
+    # Options are sorted so shuffled answer orders still match
+    text = " ".join([str(question.get('question', ''))] + sorted(options)).lower()
+    words = _WORD.findall(text)
+    if len(words) < 2:
+        return {zlib.crc32(" ".join(words).encode())}
+    return {
+        zlib.crc32(f"{words[i]} {words[i + 1]}".encode())
+        for i in range(len(words) - 1)
+    }
+
+def minhash_signature(question):
+    """Compute the MinHash signature of a question"""
+    global _hash_arrays
+    import numpy as np  # Loaded with the first exam, not at startup
+
+    if _hash_arrays is None:
+        _hash_arrays = tuple(np.array(values, dtype=np.uint64) for values in zip(*_PERMUTATIONS))
+    a, b = _hash_arrays
+    shingles = np.fromiter(question_shingles(question), dtype=np.uint64)
+    # One row per shingle, one column per permutation
+    hashed = (shingles[:, None] * a + b) % np.uint64(_PRIME)
+    # Packed 32-bit array: 256 bytes of values per signature
+    return array('I', hashed.min(axis=0).astype(np.uint32).tobytes())
+
+def signature_similarity(sig_a, sig_b):
+    """Estimate Jaccard similarity from two signatures"""
+    matches = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return matches / NUM_PERM
+
+class _ScopeIndex:
+    """One scope's questions in insertion order, stored in packed arrays"""
+
+    __slots__ = ('keys', 'positions', 'first', 'signatures', 'bands')
+
+    def __init__(self):
+        self.keys = []
+        # key: position + first. Dropping the oldest question only bumps
+        # ``first`` instead of renumbering every other key
+        self.positions = {}
+        self.first = 0
+        self.signatures = array('I')                          # NUM_PERM values per question
+        # One 4-byte band hash per question in each column; bytearray.find
+        # scans these much faster than comparing array elements one by one
+        self.bands = [bytearray() for _ in range(NUM_BANDS)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def position(self, key):
+        """Position of a key's question, or None if it isn't stored"""
+        number = self.positions.get(key)
+        return None if number is None else number - self.first
+
+    def signature(self, position):
+        return self.signatures[position * NUM_PERM:(position + 1) * NUM_PERM]
+
+    def append(self, key, signature, bands):
+        self.positions[key] = self.first + len(self.keys)
+        self.keys.append(key)
+        self.signatures.extend(signature)
+        for column, value in zip(self.bands, bands):
+            column += value.to_bytes(4, 'little')
+
+    def delete(self, position):
+        del self.positions[self.keys.pop(position)]
+        if position == 0:
+            self.first += 1
+        else:
+            for key in self.keys[position:]:
+                self.positions[key] -= 1
+        del self.signatures[position * NUM_PERM:(position + 1) * NUM_PERM]
+        for column in self.bands:
+            del column[position * 4:(position + 1) * 4]
+
+    def candidates(self, bands):
+        """Positions of questions sharing at least one band with ``bands``"""
+        found = set()
+        for column, value in zip(self.bands, bands):
+            needle = value.to_bytes(4, 'little')
+            offset = column.find(needle)
+            while offset != -1:
+                if offset % 4 == 0:  # Skip matches straddling two entries
+                    found.add(offset // 4)
+                offset = column.find(needle, offset + 1)
+        return sorted(found)
+
+def band_hashes(signature):
+    """32-bit hash of each band of a signature"""
+    return [
+        zlib.crc32(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes())
+        for band in range(NUM_BANDS)
+    ]
+
+class QuestionIndex:
+    """Incremental, size-bounded MinHash/LSH index of stored exam questions.
+
+    Questions are grouped by scope (the owning user) so lookups only
+    compare against that user's history. Each scope keeps its signatures
+    and band hashes in packed arrays (~500 bytes per question, key
+    included) and is scanned for band matches, rather than holding a hash
+    bucket per band per question. A scope keeps at most ``max_per_scope``
+    questions, dropping its oldest; past ``max_items`` in total, the least
+    recently used scopes are evicted.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_items=MAX_INDEXED_QUESTIONS,
+                 max_per_scope=MAX_QUESTIONS_PER_SCOPE):
+        self.threshold = threshold
+        self.max_items = max_items
+        self.max_per_scope = max_per_scope
+        self._scopes = OrderedDict()  # scope: _ScopeIndex, least recently used first
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def query(self, scope, signature):
+        """Return the key of a stored near-duplicate, or None"""
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is None:
+                return None
+            self._scopes.move_to_end(scope)
+            for position in index.candidates(band_hashes(signature)):
+                if signature_similarity(signature, index.signature(position)) >= self.threshold:
+                    return index.keys[position]
+            return None
+
+    def insert(self, scope, key, signature):
+        """Add a question signature to the index"""
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is None:
+                index = self._scopes[scope] = _ScopeIndex()
+            elif index.position(key) is not None:
+                index.delete(index.position(key))
+                self._count -= 1
+            self._scopes.move_to_end(scope)
+            index.append(key, signature, band_hashes(signature))
+            self._count += 1
+            
+            while len(index) > self.max_per_scope:
+                index.delete(0)
+                self._count -= 1
+            while self._count > self.max_items and len(self._scopes) > 1:
+                _, evicted = self._scopes.popitem(last=False)
+                self._count -= len(evicted)
+
+    def remove(self, scope, key):
+        """Drop a question from the index"""
+        with self._lock:
+            index = self._scopes.get(scope)
+            position = index.position(key) if index is not None else None
+            if position is not None:
+                index.delete(position)
+                self._count -= 1
+
+    def filter_new_questions(self, scope, questions, accepted=None):
+        """Split questions into (unique, duplicates) against the index and each other.
+
+        ``accepted`` holds (question, signature) pairs already kept for the
+        exam being built. The returned unique list extends it, pairing each
+        question with its signature so the caller can index them once the
+        exam is stored.
+        """
+        unique = list(accepted or [])
+        duplicates = []
+        for question in questions:
+            signature = minhash_signature(question)
+            is_duplicate = self.query(scope, signature) is not None or any(
+                signature_similarity(signature, kept_sig) >= self.threshold
+                for _, kept_sig in unique
+            )
+            if is_duplicate:
+                duplicates.append(question)
+            else:
+                unique.append((question, signature))
+        return unique, duplicates
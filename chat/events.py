@@ -0,0 +1,33 @@
+import threading
+
+class SessionEvents:
+    """Fan-out of server-side events (exam ready, feedback ready) to listeners.
+
+    Listeners are plain callables registered per tutoring session; the
+    WebSocket channel registers one per connection. Publishing never
+    blocks, so views can call it from any thread.
+    """
+
+    def __init__(self):
+        self._listeners = {}  # session_id: set of callables
+        self._lock = threading.Lock()
+
+    def subscribe(self, session_id, listener):
+        with self._lock:
+            self._listeners.setdefault(session_id, set()).add(listener)
+
+    def unsubscribe(self, session_id, listener):
+        with self._lock:
+            listeners = self._listeners.get(session_id)
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._listeners[session_id]
+
+    def publish(self, session_id, event):
+        with self._lock:
+            listeners = list(self._listeners.get(session_id, ()))
+        for listener in listeners:
+            listener(event)
+
+session_events = SessionEvents()
@@ -0,0 +1,125 @@
+import itertools
+import json
+import re
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+# Deterministic stand-in for the Gemini client, selected with
+# GEMINI_BACKEND = 'fake'. It mirrors the parts of the SDK surface the app
+# uses (models.generate_content[_stream] and their aio counterparts) so
+# tests and load runs need no network access or API key.
+
+_question_ids = itertools.count(1)
+_QUESTION_COUNT = re.compile(r"create (\d+) (?:new )?multiple choice", re.IGNORECASE)
+_TOPIC = re.compile(r"(?:Topic|Subject|concept): ([^\n]+)")
+
+def _fake_exam(prompt):
+    match = _QUESTION_COUNT.search(prompt)
+    count = int(match.group(1)) if match else 5
+    topic_match = _TOPIC.search(prompt)
+    topic = topic_match.group(1).strip() if topic_match else "General"
+    questions = []
+    for number in range(1, count + 1):
+        # A global counter keeps questions distinct across calls
+        serial = next(_question_ids)
+        questions.append({
+            "question_id": number,
+            "question": f"Fake question {serial} about {topic}: which option is correct?",
+            "options": [f"A) Answer {serial}", "B) Distractor one", "C) Distractor two", "D) Distractor three"],
+            "correct_answer": "A",
+            "explanation": f"Option A is correct for fake question {serial}."
+        })
+    return json.dumps({"exam_id": "fake", "topic": topic, "difficulty": "medium", "questions": questions})
+
+def _fake_learning_path(prompt):
+    topic_match = _TOPIC.search(prompt)
+    subject = topic_match.group(1).strip() if topic_match else "General"
+    return json.dumps({
+        "learning_path": [{
+            "module": f"Foundations of {subject}",
+            "topics": [f"{subject} basics", f"{subject} practice"],
+            "estimated_duration": "2-3 hours",
+            "difficulty": "beginner",
+            "prerequisites": []
+        }],
+        "recommended_next_session": f"{subject} basics",
+        "study_tips": ["Practice daily"]
+    })
+
+def fake_reply(config, contents):
+    """Produce a canned response shaped like what the prompt asks for"""
+    prompt = contents if isinstance(contents, str) else str(contents)
+    if _QUESTION_COUNT.search(prompt):
+        return _fake_exam(prompt)
+    if "learning path" in prompt.lower():
+        return _fake_learning_path(prompt)
+    last_line = prompt.strip().splitlines()[-1] if prompt.strip() else ""
+    reply = f"This is a fake tutor reply to: {last_line[:200]}"
+    if "Next concepts:" in (getattr(config, 'system_instruction', None) or ""):
+        # Follow the tutoring instruction to end with suggested concepts
+        reply += "\n\nNext concepts: Worked examples, Practice problems"
+    return reply
+
+def _chunks(text, size=3):
+    words = text.split(" ")
+    for i in range(0, len(words), size):
+        piece = " ".join(words[i:i + size])
+        yield SimpleNamespace(text=piece if i == 0 else " " + piece)
+
+class FakeModels:
+    def generate_content(self, model, config=None, contents=None):
+        return SimpleNamespace(text=fake_reply(config, contents))
+
+    def generate_content_stream(self, model, config=None, contents=None):
+        return _chunks(fake_reply(config, contents))
+
+class FakeAsyncModels:
+    async def generate_content(self, model, config=None, contents=None):
+        return SimpleNamespace(text=fake_reply(config, contents))
+
+    async def generate_content_stream(self, model, config=None, contents=None):
+        async def stream():
+            for chunk in _chunks(fake_reply(config, contents)):
+                yield chunk
+        return stream()
+
+class FakeClient:
+    def __init__(self):
+        self.models = FakeModels()
+        self.aio = SimpleNamespace(models=FakeAsyncModels())
+
+class RecordedModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model, config=None, contents=None):
+        call = self._client.next_call()
+        if call is None:
+            return SimpleNamespace(text=fake_reply(config, contents))
+        if self._client.simulate_latency:
+            time.sleep(call.get('latency_ms', 0) / 1000)
+        return SimpleNamespace(text=call['text'])
+
+class RecordedClient:
+    """Serves the model responses captured in a traffic log, in order.
+
+    The replay tool primes it with each logged request's ``llm_calls``
+    before sending that request; calls beyond what was recorded fall back
+    to the fake backend.
+    """
+
+    def __init__(self, simulate_latency=False):
+        self.simulate_latency = simulate_latency
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self.models = RecordedModels(self)
+
+    def prime(self, calls):
+        with self._lock:
+            self._pending = deque(calls or [])
+
+    def next_call(self):
+        with self._lock:
+            return self._pending.popleft() if self._pending else None
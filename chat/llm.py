@@ -0,0 +1,61 @@
+import os
+import threading
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# The Gemini SDK and client are created on first use rather than at import,
+# so management commands, migrations and worker boot don't pay for them
+# and don't need an API key.
+_client = None
+_client_lock = threading.Lock()
+
+# When traffic recording is on, holds the list that model calls made while
+# serving the current request are appended to
+recorded_calls = ContextVar('recorded_calls', default=None)
+
+def get_client():
+    """Return the shared Gemini client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+def _create_client():
+    if getattr(settings, 'GEMINI_BACKEND', 'gemini') == 'fake':
+        from .fake_llm import FakeClient
+        return FakeClient()
+    
+    from dotenv import load_dotenv
+    from google import genai
+    
+    load_dotenv()
+    return genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+def reset_client():
+    """Drop the shared client so the next call rebuilds it (e.g. after changing backend)"""
+    global _client
+    with _client_lock:
+        _client = None
+
+def install_client(client):
+    """Replace the shared client, e.g. with a replay backend"""
+    global _client
+    with _client_lock:
+        _client = client
+
+def generation_config(**kwargs):
+    """Build a GenerateContentConfig without importing the SDK up front"""
+    if getattr(settings, 'GEMINI_BACKEND', 'gemini') == 'fake':
+        from types import SimpleNamespace
+        return SimpleNamespace(**kwargs)
+    from google.genai import types
+    return types.GenerateContentConfig(**kwargs)
+
+def prewarm_client():
+    """Create the client in the background so the first request doesn't wait"""
+    thread = threading.Thread(target=get_client, name="gemini-prewarm", daemon=True)
+    thread.start()
+    return thread
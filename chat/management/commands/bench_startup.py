@@ -0,0 +1,55 @@
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Each scenario runs in a fresh interpreter so import caches don't carry over
+SCENARIOS = {
+    "django_setup": "import django; django.setup()",
+    "app_urls": "import django; django.setup(); import gemini_chatbot.urls",
+    "first_client": (
+        "import django; django.setup(); import gemini_chatbot.urls; "
+        "from chat.llm import get_client; get_client()"
+    ),
+    "genai_import": "from google import genai",
+}
+
+TIMER = (
+    "import os, time; "
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gemini_chatbot.settings'); "
+    "os.environ.setdefault('GEMINI_API_KEY', 'benchmark'); "
+    "start = time.perf_counter(); {code}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+class Command(BaseCommand):
+    help = "Measure cold import/startup time of the app in fresh interpreters"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Runs per scenario")
+        parser.add_argument(
+            "--scenario", action="append", choices=sorted(SCENARIOS),
+            help="Scenario to run (repeatable, default: all)"
+        )
+
+    def handle(self, *args, **options):
+        for name in options["scenario"] or SCENARIOS:
+            timings = []
+            for _ in range(options["runs"]):
+                result = subprocess.run(
+                    [sys.executable, "-c", TIMER.format(code=SCENARIOS[name])],
+                    cwd=settings.BASE_DIR, capture_output=True, text=True
+                )
+                if result.returncode != 0:
+                    self.stderr.write(f"{name}: failed\n{result.stderr.strip()}")
+                    break
+                timings.append(float(result.stdout.strip().splitlines()[-1]) * 1000)
+            
+            if timings:
+                self.stdout.write(
+                    f"{name:<14} median {statistics.median(timings):8.1f} ms  "
+                    f"min {min(timings):8.1f} ms  runs {len(timings)}"
+                )
@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.state import DictBackend, SQLiteBackend
+
+def new_session(session_id):
+    return {
+        'session_id': session_id,
+        'user_id': 'bench',
+        'topic': 'Benchmarking',
+        'conversation_history': [],
+        'concepts_covered': [],
+        'version': 1
+    }
+
+def run_turns(backend, session_ids, turns):
+    """The state traffic of tutoring_chat: read a session, append two turns, save"""
+    sessions = backend.table('sessions')
+    for turn in range(turns):
+        for session_id in session_ids:
+            with backend.unit_of_work():
+                session = sessions[session_id]
+                session['conversation_history'].append({"role": "user", "content": f"Question {turn}"})
+                session['conversation_history'].append({"role": "assistant", "content": f"Answer {turn}"})
+                session['version'] += 1
+
+def create_sessions(backend, session_ids):
+    sessions = backend.table('sessions')
+    for session_id in session_ids:
+        with backend.unit_of_work():
+            sessions[session_id] = new_session(session_id)
+
+def _sqlite_worker(path, session_ids, turns):
+    run_turns(SQLiteBackend(path), session_ids, turns)
+
+
+class Command(BaseCommand):
+    help = "Compare state backend throughput on a tutoring-chat-like workload"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sessions", type=int, default=500, help="Sessions to create")
+        parser.add_argument("--turns", type=int, default=5, help="Chat turns per session")
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Processes sharing the SQLite file for the multi-worker run")
+
+    def handle(self, *args, **options):
+        session_ids = [f"bench-{n}" for n in range(options["sessions"])]
+        turns = options["turns"]
+        operations = len(session_ids) * turns
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "state.sqlite3")
+            for name, backend in (("dict", DictBackend()), ("sqlite", SQLiteBackend(path))):
+                start = time.perf_counter()
+                create_sessions(backend, session_ids)
+                created = time.perf_counter() - start
+                start = time.perf_counter()
+                run_turns(backend, session_ids, turns)
+                updated = time.perf_counter() - start
+                self.report(f"{name}, 1 process", len(session_ids), created, operations, updated)
+
+            # Workers update disjoint sessions concurrently through the same file
+            workers = options["workers"]
+            context = multiprocessing.get_context("fork")
+            processes = [
+                context.Process(target=_sqlite_worker, args=(path, session_ids[n::workers], turns))
+                for n in range(workers)
+            ]
+            start = time.perf_counter()
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            updated = time.perf_counter() - start
+            if any(process.exitcode for process in processes):
+                self.stderr.write("A worker failed; results are incomplete")
+            self.report(f"sqlite, {workers} processes", 0, 0, operations, updated)
+
+    def report(self, label, created_count, created, updated_count, updated):
+        create_rate = f"{created_count / created:10.0f} creates/s" if created else " " * 20
+        self.stdout.write(f"{label:<22} {create_rate}  {updated_count / updated:10.0f} turns/s")
@@ -0,0 +1,45 @@
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.bulk import EXPORT_TYPES, export_cursor, iter_ndjson
+from chat.pagination import PaginationError, parse_time_bound
+from chat.views import iter_export_records
+
+
+class Command(BaseCommand):
+    help = "Export sessions, transcripts and graded exams as NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", "-o", help="Output file (default: stdout)")
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output")
+        parser.add_argument("--since", help="Only records changed at or after this ISO timestamp")
+        parser.add_argument(
+            "--types", default=",".join(EXPORT_TYPES),
+            help="Comma-separated record types to export (default: %(default)s)"
+        )
+
+    def handle(self, *args, **options):
+        types = tuple(t for t in options["types"].split(",") if t in EXPORT_TYPES)
+        try:
+            since = parse_time_bound(options["since"], "--since")
+        except PaginationError as e:
+            raise CommandError(str(e))
+        cursor = export_cursor()
+        
+        raw = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        out = gzip.GzipFile(fileobj=raw, mode="wb") if options["gzip"] else raw
+        try:
+            for chunk in iter_ndjson(iter_export_records(since, types)):
+                out.write(chunk)
+        finally:
+            if out is not raw:
+                out.close()
+            if options["output"]:
+                raw.close()
+            else:
+                raw.flush()
+        
+        # Pass this back as --since for the next incremental export
+        self.stderr.write(f"Next cursor: {cursor}")
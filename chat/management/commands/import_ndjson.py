@@ -0,0 +1,28 @@
+import gzip
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.bulk import IMPORT_BATCH_SIZE, read_ndjson
+from chat.views import import_records
+
+
+class Command(BaseCommand):
+    help = "Import an NDJSON export (plain or .gz) in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="NDJSON file; gzip is detected from the .gz suffix")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        opener = gzip.open if path.endswith(".gz") else open
+        
+        try:
+            with opener(path, "rb") as lines:
+                counts = import_records(read_ndjson(lines), options["batch_size"])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Import failed: {e}")
+        
+        self.stdout.write(
+            f"Imported {counts['sessions']} sessions and {counts['exams']} exams"
+        )
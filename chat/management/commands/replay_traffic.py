@@ -0,0 +1,63 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from chat.fake_llm import FakeClient, RecordedClient
+from chat.llm import install_client
+from chat.traffic import compare_reports, read_log, replay
+
+
+class Command(BaseCommand):
+    help = "Replay a recorded traffic log against this build and report latency/error deltas"
+
+    def add_arguments(self, parser):
+        parser.add_argument("log", nargs="?", help="Traffic log (default: TRAFFIC_LOG_PATH)")
+        parser.add_argument(
+            "--speed", type=float, default=1.0,
+            help="Multiple of the recorded request rate; 0 sends back to back (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--backend", choices=("recorded", "fake", "live"), default="recorded",
+            help="Where model calls go: recorded responses, the fake backend, or the real API"
+        )
+        parser.add_argument(
+            "--model-latency", action="store_true",
+            help="With --backend recorded, sleep for each call's recorded latency"
+        )
+        parser.add_argument("--host", default="localhost", help="Host header to send (must be in ALLOWED_HOSTS)")
+        parser.add_argument("--output", "-o", help="Write the JSON report here")
+        parser.add_argument("--baseline", help="Earlier report to compare p95 and error rates against")
+
+    def handle(self, *args, **options):
+        path = options["log"] or settings.TRAFFIC_LOG_PATH
+        if options["speed"] < 0:
+            raise CommandError("--speed must be zero or positive")
+        
+        on_request = None
+        if options["backend"] != "live":
+            settings.GEMINI_BACKEND = 'fake'
+            # Background speculation would take recorded responses out of order
+            settings.PREFETCH_ENABLED = False
+            if options["backend"] == "recorded":
+                client = RecordedClient(simulate_latency=options["model_latency"])
+                on_request = lambda entry: client.prime(entry.get("llm_calls"))
+            else:
+                client = FakeClient()
+            install_client(client)
+        
+        try:
+            report = replay(read_log(path), Client(HTTP_HOST=options["host"]), speed=options["speed"], on_request=on_request)
+        except FileNotFoundError:
+            raise CommandError(f"No traffic log at {path}")
+        
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                report["compared_to_baseline"] = compare_reports(json.load(f), report)
+        
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(text)
+        self.stdout.write(text)
@@ -0,0 +1,205 @@
+import random
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+from .llm import recorded_calls
+from .profiling import (
+    CallProfile,
+    SlowRequestReports,
+    profiling_active,
+    record_span,
+    server_timing,
+    start_spans,
+    stop_spans,
+)
+from .state import get_backend
+from .traffic import (
+    MAX_RECORDED_BODY_BYTES,
+    RECORDED_HEADERS,
+    RECORDED_RESPONSE_HEADERS,
+    TrafficLog,
+    decode_body,
+    recorded_headers,
+)
+
+try:
+    import brotli
+except ImportError:  # Optional dependency, gzip still applies without it
+    brotli = None
+
+MIN_COMPRESS_LENGTH = 200  # Same cut-off as Django's GZipMiddleware
+BROTLI_QUALITY = 5         # Good ratio without the CPU cost of max quality
+
+_accepts_brotli = re.compile(r"\bbr\b")
+
+class BrotliMiddleware:
+    """Brotli-compress large responses for clients that accept it.
+
+    Sits just inside GZipMiddleware, which skips responses that already
+    carry a Content-Encoding, so gzip remains the fallback.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        
+        if brotli is None or response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < MIN_COMPRESS_LENGTH:
+            return response
+        
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not _accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return response
+        
+        compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = 'br'
+        
+        # The encoded body is no longer byte-identical to the original
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        
+        return response
+
+class TrafficRecorderMiddleware:
+    """Append sanitized request/response pairs to a JSONL log for replay.
+
+    Disabled unless TRAFFIC_RECORDING is set, in which case Django drops
+    the middleware at startup and it costs nothing per request. Model
+    responses produced while serving each request are logged alongside it
+    so the replay tool can serve them back.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRAFFIC_RECORDING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = getattr(settings, 'TRAFFIC_RECORD_PREFIX', '/api/')
+        self.log = TrafficLog(settings.TRAFFIC_LOG_PATH)
+
+    def __call__(self, request):
+        if not request.path.startswith(self.prefix):
+            return self.get_response(request)
+        
+        # Reading the body here keeps it available to the view; very large
+        # bodies (bulk imports) are left alone and only their size is logged
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if content_length > MAX_RECORDED_BODY_BYTES:
+            request_body = {"_omitted_bytes": content_length}
+        else:
+            request_body = decode_body(request.body, request.headers.get('Content-Encoding'),
+                                       request.content_type)
+        
+        calls = []
+        token = recorded_calls.set(calls)
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            recorded_calls.reset(token)
+        duration_ms = (time.perf_counter() - start) * 1000
+        
+        self.log.append({
+            "ts": started_at,
+            "method": request.method,
+            "path": request.path,
+            "query": request.META.get('QUERY_STRING', ''),
+            "headers": recorded_headers(request.headers, RECORDED_HEADERS),
+            "request": request_body,
+            "status": response.status_code,
+            "duration_ms": round(duration_ms, 2),
+            "response_headers": recorded_headers(response.headers, RECORDED_RESPONSE_HEADERS),
+            "response": None if response.streaming else decode_body(response.content),
+            "llm_calls": calls
+        })
+        return response
+
+class ProfilingMiddleware:
+    """Time request phases and capture reports for slow requests.
+
+    A PROFILING_SAMPLE_RATE fraction of requests, plus any sent with the
+    PROFILING_HEADER header set to 1, collect span timings (see
+    chat.profiling.span) and run under cProfile. Their phases are returned
+    in a Server-Timing header, and those slower than PROFILING_SLOW_MS are
+    written to PROFILING_REPORT_DIR. Disabled unless PROFILING_ENABLED is
+    set, in which case Django drops the middleware at startup.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.01)
+        self.header = getattr(settings, 'PROFILING_HEADER', None)
+        self.slow_ms = getattr(settings, 'PROFILING_SLOW_MS', 1000)
+        self.reports = SlowRequestReports(settings.PROFILING_REPORT_DIR,
+                                          getattr(settings, 'PROFILING_MAX_REPORTS', 200))
+
+    def __call__(self, request):
+        forced = bool(self.header) and request.headers.get(self.header) == '1'
+        if not forced and random.random() >= self.sample_rate:
+            return self.get_response(request)
+        
+        spans, token = start_spans()
+        start = time.perf_counter()
+        try:
+            with CallProfile() as profile:
+                response = self.get_response(request)
+        finally:
+            stop_spans(token)
+        duration_ms = (time.perf_counter() - start) * 1000
+        
+        response['Server-Timing'] = ", ".join(filter(None, [server_timing(spans), f"total;dur={duration_ms:.1f}"]))
+        if duration_ms >= self.slow_ms:
+            self.reports.write({
+                "method": request.method,
+                "path": request.path,
+                "query": request.META.get('QUERY_STRING', ''),
+                "status": response.status_code,
+                "duration_ms": round(duration_ms, 2),
+                "forced": forced,
+                "phases": {name: {"ms": round(total, 2), "calls": calls}
+                           for name, (total, calls) in spans.items()},
+                "profile": profile.top_functions()
+            })
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF renders the response after the view returns; time that as "serialize"
+        if not profiling_active():
+            return response
+        start = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: record_span('serialize', start))
+        return response
+
+class StateMiddleware:
+    """Run each request in a unit of work on shared state backends.
+
+    Records the view reads are cached for the request and the changed ones
+    are written back in a single transaction when it finishes. With the
+    default in-process dict backend there is nothing to do, so Django drops
+    the middleware at startup.
+    """
+
+    def __init__(self, get_response):
+        self.backend = get_backend()
+        if not self.backend.shared:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with self.backend.unit_of_work():
+            return self.get_response(request)
@@ -0,0 +1,79 @@
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+class PaginationError(ValueError):
+    """Raised for malformed pagination or filter parameters"""
+
+def encode_cursor(timestamp, item_id):
+    """Turn the last returned entry's timestamp and ID into an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps([timestamp, item_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    """Recover the (timestamp, ID) stored in a cursor"""
+    try:
+        position = json.loads(base64.b64decode(cursor.encode(), altchars=b'-_', validate=True))
+    except (ValueError, UnicodeDecodeError):
+        raise PaginationError("Invalid cursor")
+    if (not isinstance(position, list) or len(position) != 2
+            or not all(isinstance(part, str) for part in position)):
+        raise PaginationError("Invalid cursor")
+    return position
+
+def parse_time_bound(value, name):
+    """Validate a since/until value and normalize it to the stored ISO format"""
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise PaginationError(f"{name} must be an ISO datetime")
+    if moment.tzinfo is not None:
+        # Stored timestamps are naive local time
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment.isoformat()
+
+def parse_page_size(value):
+    """Validate the requested page size"""
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise PaginationError("limit must be an integer")
+    if limit < 1:
+        raise PaginationError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+def paginate_by_time(ids, timestamp_of, limit, cursor=None, since=None, until=None):
+    """Return one page of ``ids``, newest first, plus the cursor for the next page.
+
+    ``ids`` must already be in ascending timestamp order (it is an
+    append-only history list), so the date range and cursor are resolved
+    with binary search and the cost does not grow with the history size.
+    ``since`` is inclusive and ``until`` exclusive; both are ISO strings.
+    Cursors hold the last entry's ID as well as its timestamp, so entries
+    sharing a timestamp (e.g. imported records) are neither skipped nor
+    repeated.
+    """
+    since = parse_time_bound(since, "since")
+    until = parse_time_bound(until, "until")
+    lo = bisect_left(ids, since, key=timestamp_of) if since else 0
+    hi = bisect_left(ids, until, key=timestamp_of) if until else len(ids)
+    if cursor:
+        timestamp, last_id = decode_cursor(cursor)
+        position = bisect_left(ids, timestamp, key=timestamp_of)
+        tie_end = bisect_right(ids, timestamp, key=timestamp_of)
+        # Ties keep insertion order; resume just before the last returned one
+        while position < tie_end and ids[position] != last_id:
+            position += 1
+        hi = min(hi, position)
+    
+    start = max(lo, hi - limit)
+    page = ids[start:hi][::-1]
+    next_cursor = encode_cursor(timestamp_of(page[-1]), page[-1]) if page and start > lo else None
+    return page, next_cursor
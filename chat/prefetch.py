@@ -0,0 +1,306 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .routing import router
+
+EXPLANATION_CACHE_SIZE = 500       # Explanations kept per process
+EXPLANATION_TTL_SECONDS = 60 * 60
+MAX_CONCEPTS_PER_REPLY = 2
+PREFETCH_ROUTE = 'explain_prefetch'
+
+# Tutoring replies are asked to end with "Next concepts: a, b"; replies
+# that don't are checked for common "next we'll cover ..." phrasings
+_NEXT_LINE = re.compile(r"^[ \t*_]*next concepts?[ \t*_]*:[ \t]*(.+?)[ \t]*$", re.IGNORECASE | re.MULTILINE)
+_NEXT_LINE_START = re.compile(r"[ \t*_]*next concepts?[ \t*_]*:", re.IGNORECASE)
+_NEXT_LINE_PREFIX = re.compile(r"next concepts?[ \t*_]*", re.IGNORECASE)
+_NEXT_PHRASE = re.compile(
+    r"\b(?:next,? (?:we(?:'ll| will| can)|let's|you can) (?:explore|cover|look at|learn about|move on to|discuss)"
+    r"|(?:ready to|we can|let's) move on to)\s+([^.?!:;\n]{3,60})",
+    re.IGNORECASE
+)
+_LEADING_ARTICLE = re.compile(r"^(?:the|a|an)\s+", re.IGNORECASE)
+
+def _clean_concept(text):
+    text = _LEADING_ARTICLE.sub("", text.strip(" \t*_`\"'"))
+    return text.strip(" \t*_`\"'")
+
+def extract_next_concepts(reply):
+    """Split a tutoring reply into the text to show and the concepts it suggests next"""
+    concepts = []
+    match = _NEXT_LINE.search(reply)
+    if match:
+        concepts = [_clean_concept(part) for part in re.split(r",|;", match.group(1))]
+        reply = (reply[:match.start()] + reply[match.end():]).strip()
+    else:
+        concepts = [_clean_concept(found) for found in _NEXT_PHRASE.findall(reply)]
+
+    unique = []
+    for concept in concepts:
+        if concept and concept.lower() not in (c.lower() for c in unique):
+            unique.append(concept)
+    return reply, unique[:MAX_CONCEPTS_PER_REPLY]
+
+def _may_be_next_line(line):
+    """Whether a partial line could still turn out to be a "Next concepts:" line"""
+    if _NEXT_LINE_START.match(line):
+        return True
+    head = line.lstrip(" \t*_").lower()
+    return "next concepts".startswith(head) or _NEXT_LINE_PREFIX.fullmatch(head) is not None
+
+class NextConceptsFilter:
+    """Hide the "Next concepts:" line from a reply streamed in pieces.
+
+    A line is held back while it could still be that line, and whitespace
+    until text follows it, so the pieces passed on join up to exactly the
+    reply extract_next_concepts() returns for the whole text.
+    """
+
+    def __init__(self):
+        self._line = None   # Start of the current line while it is held back
+        self._space = ""    # Whitespace not yet followed by text
+        self._started = False
+        self._line_start = True
+
+    def feed(self, text):
+        """Take the next piece of the reply; returns the part that can be shown now"""
+        out = []
+        for piece in re.split(r"(\n)", text):
+            if piece == "\n":
+                if self._line is not None:
+                    line, self._line = self._line, None
+                    if not _NEXT_LINE.fullmatch(line):
+                        out.append(self._show(line))
+                out.append(self._show(piece))
+                self._line_start = True
+            elif piece:
+                if self._line_start:
+                    self._line = ""
+                    self._line_start = False
+                if self._line is None:
+                    out.append(self._show(piece))
+                else:
+                    self._line += piece
+                    if not _may_be_next_line(self._line):
+                        line, self._line = self._line, None
+                        out.append(self._show(line))
+        return "".join(out)
+
+    def finish(self):
+        """Whatever was still held back once the reply is complete"""
+        line, self._line = self._line, None
+        if line is None or _NEXT_LINE.fullmatch(line):
+            return ""
+        return self._show(line)
+
+    def _show(self, text):
+        text = self._space + text
+        stripped = text.rstrip()
+        self._space = text[len(stripped):]
+        if not self._started:
+            stripped = stripped.lstrip()
+            self._started = bool(stripped)
+        return stripped
+
+def explanation_key(concept, difficulty, explanation_type, context):
+    return (" ".join(concept.lower().split()), difficulty, explanation_type, context)
+
+class ExplanationCache:
+    """LRU cache of generated explanations with expiry.
+
+    Entries written by the prefetcher are flagged so the first request
+    served from one counts as a prefetch hit, and ones evicted or expired
+    unused count as wasted speculation.
+    """
+
+    def __init__(self, max_entries=EXPLANATION_CACHE_SIZE, ttl=EXPLANATION_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key: {'text', 'expires', 'prefetched', 'used'}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'prefetch_hits': 0, 'prefetch_wasted': 0}
+
+    def get(self, key):
+        """Return a cached explanation, or None, counting the hit or miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['expires'] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            if entry['prefetched'] and not entry['used']:
+                self._stats['prefetch_hits'] += 1
+            entry['used'] = True
+            return entry['text']
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry['expires'] >= time.monotonic()
+
+    def put(self, key, text, prefetched=False):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {
+                'text': text,
+                'expires': time.monotonic() + self.ttl,
+                'prefetched': prefetched,
+                'used': False
+            }
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        if entry['prefetched'] and not entry['used']:
+            self._stats['prefetch_wasted'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+        return stats
+
+class _Speculation:
+    def __init__(self):
+        self.cancelled = False
+        self.future = None
+
+class Prefetcher:
+    """Generate explanations for suggested next concepts in the background.
+
+    Work is bounded three ways: a small worker pool, a cap on speculative
+    calls queued or running (PREFETCH_MAX_PENDING), and no new speculation
+    while PREFETCH_MAX_FOREGROUND user-facing model calls are in flight,
+    so it only uses spare capacity. Each new tutoring reply replaces the
+    session's earlier speculation; queued calls for concepts it no longer
+    suggests are cancelled and results that arrive late are discarded.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._executor = None
+        # Reentrant: cancelling or submitting a future can run its done
+        # callback, which takes the lock, on this thread
+        self._lock = threading.RLock()
+        self._pending = {}  # session_id: {key: _Speculation}
+        self._in_flight = 0
+        self._stats = self._new_stats()
+
+    @staticmethod
+    def _new_stats():
+        return {'scheduled': 0, 'completed': 0, 'failed': 0, 'cancelled': 0,
+                'skipped_budget': 0, 'skipped_busy': 0}
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PREFETCH_WORKERS', 2), thread_name_prefix="prefetch")
+        return self._executor
+
+    def _foreground_busy(self):
+        limit = getattr(settings, 'PREFETCH_MAX_FOREGROUND', 4)
+        return router.in_flight(exclude=(PREFETCH_ROUTE,)) >= limit
+
+    def schedule(self, session_id, jobs):
+        """Replace a session's speculation with ``jobs``: (cache key, callable returning text)"""
+        wanted = {key for key, _ in jobs}
+        with self._lock:
+            current = self._pending.setdefault(session_id, {})
+            for key in [key for key in current if key not in wanted]:
+                speculation = current.pop(key)
+                speculation.cancelled = True
+                speculation.future.cancel()
+                self._stats['cancelled'] += 1
+
+            for key, produce in jobs:
+                if key in current or key in self.cache:
+                    continue
+                if self._in_flight >= getattr(settings, 'PREFETCH_MAX_PENDING', 8):
+                    self._stats['skipped_budget'] += 1
+                    continue
+                if self._foreground_busy():
+                    self._stats['skipped_busy'] += 1
+                    continue
+                speculation = _Speculation()
+                current[key] = speculation
+                self._in_flight += 1
+                self._stats['scheduled'] += 1
+                speculation.future = self._pool().submit(self._run, session_id, key, speculation, produce)
+                speculation.future.add_done_callback(self._finished)
+
+            if not current:
+                del self._pending[session_id]
+
+    def _finished(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _run(self, session_id, key, speculation, produce):
+        if speculation.cancelled:
+            return
+        if self._foreground_busy():
+            # Capacity was taken while this waited in the queue
+            self._release(session_id, key, speculation, 'skipped_busy')
+            return
+        try:
+            text = produce()
+        except Exception:
+            self._release(session_id, key, speculation, 'failed')
+            return
+        if not speculation.cancelled:
+            self.cache.put(key, text, prefetched=True)
+            self._release(session_id, key, speculation, 'completed')
+
+    def _release(self, session_id, key, speculation, outcome):
+        with self._lock:
+            current = self._pending.get(session_id, {})
+            if current.get(key) is speculation:
+                del current[key]
+                if not current:
+                    del self._pending[session_id]
+            if not speculation.cancelled:
+                self._stats[outcome] += 1
+
+    def wait_idle(self, timeout=5):
+        """Wait until no speculative calls are queued or running"""
+        deadline = time.monotonic() + timeout
+        while self._in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def reset(self):
+        with self._lock:
+            for current in self._pending.values():
+                for speculation in current.values():
+                    speculation.cancelled = True
+                    speculation.future.cancel()
+            self._pending.clear()
+            self._stats = self._new_stats()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, in_flight=self._in_flight)
+        cache = self.cache.stats()
+        stats['cache'] = cache
+        # Share of finished speculation that a later request actually used
+        stats['prefetch_hit_rate'] = (round(cache['prefetch_hits'] / stats['completed'], 4)
+                                      if stats['completed'] else None)
+        return stats
+
+explanation_cache = ExplanationCache()
+prefetcher = Prefetcher(explanation_cache)
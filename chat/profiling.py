@@ -0,0 +1,110 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+# Phase timings for the request being profiled: {phase: [total_ms, calls]}.
+# None whenever profiling is off, so span() is a single lookup per phase.
+_spans = ContextVar('profiling_spans', default=None)
+
+# Only one cProfile profiler can run per process on recent Pythons, so
+# concurrent sampled requests get phase timings but no call profile
+_profiler_lock = threading.Lock()
+
+@contextmanager
+def span(name):
+    """Time a named phase of the current request when it is being profiled"""
+    spans = _spans.get()
+    if spans is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, start, spans)
+
+def profiling_active():
+    return _spans.get() is not None
+
+def record_span(name, start, spans=None):
+    """Add the time since ``start`` to phase ``name``"""
+    spans = _spans.get() if spans is None else spans
+    if spans is None:
+        return
+    entry = spans.setdefault(name, [0.0, 0])
+    entry[0] += (time.perf_counter() - start) * 1000
+    entry[1] += 1
+
+def start_spans():
+    """Begin collecting phase timings; returns the token for stop_spans()"""
+    spans = {}
+    return spans, _spans.set(spans)
+
+def stop_spans(token):
+    _spans.reset(token)
+
+def server_timing(spans):
+    """Phase timings as a Server-Timing header value"""
+    return ", ".join(f"{name};dur={total:.1f}" for name, (total, _) in spans.items())
+
+class CallProfile:
+    """cProfile for one request, skipped if another request holds the profiler"""
+
+    def __init__(self):
+        self.profiler = None
+
+    def __enter__(self):
+        if _profiler_lock.acquire(blocking=False):
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Another profiling tool (e.g. a debugger) is active
+                self.profiler = None
+                _profiler_lock.release()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.disable()
+            _profiler_lock.release()
+        return False
+
+    def top_functions(self, limit=30):
+        if self.profiler is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+class SlowRequestReports:
+    """Write slow-request reports as JSON files, keeping only the newest ``max_reports``"""
+
+    def __init__(self, directory, max_reports=200):
+        self.directory = directory
+        self.max_reports = max_reports
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, report):
+        name = f"{datetime.now().strftime('%Y%m%dT%H%M%S.%f')}-{threading.get_ident()}.json"
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        self._rotate()
+        return name
+
+    def _rotate(self):
+        with self._lock:
+            reports = sorted(f for f in os.listdir(self.directory) if f.endswith(".json"))
+            for stale in reports[:max(len(reports) - self.max_reports, 0)]:
+                try:
+                    os.remove(os.path.join(self.directory, stale))
+                except FileNotFoundError:
+                    pass  # Removed by another worker
@@ -0,0 +1,158 @@
+import json
+import re
+import threading
+
+# Token budgets for the variable parts of each prompt (the fixed template
+# text is small and not counted against these)
+PROMPT_BUDGETS = {
+    'chat': 2000,              # Legacy endpoint's single user message
+    'tutoring_start': 500,     # Learning goals
+    'tutoring_chat': 3000,     # Recent conversation turns
+    'session_objectives': 500, # A session's learning objectives
+    'session_concepts': 500,   # Concepts covered so far, most recent kept
+    'exam_generate': 4000,     # Session summary of assistant messages
+    'exam_feedback': 2000,     # Per-question results
+    'explain_concept': 1000,   # Caller-supplied context
+    'learning_path': 500,      # Goals list
+}
+MAX_MESSAGE_TOKENS = 1500      # A single turn never takes more than this
+OMITTED = "[...]"
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def estimate_tokens(text):
+    """Cheap local estimate of the model's token count for ``text``.
+
+    Counts each punctuation mark as one token and each word as one token
+    per four characters, which tracks SentencePiece-style tokenizers
+    closely enough for budgeting without a round trip to the API.
+    """
+    if not text:
+        return 0
+    return sum((len(piece) + 3) // 4 for piece in _TOKEN.findall(text))
+
+def truncate_to_tokens(text, budget, keep='start'):
+    """Cut ``text`` to about ``budget`` tokens, keeping its start or end"""
+    if estimate_tokens(text) <= budget:
+        return text
+    # ~4 characters per token; trim then tighten until under budget
+    limit = max(budget * 4, 0)
+    while limit > 0:
+        cut = f"{text[:limit]} {OMITTED}" if keep == 'start' else f"{OMITTED} {text[-limit:]}"
+        if estimate_tokens(cut) <= budget:
+            return cut
+        limit = int(limit * 0.9)
+    return OMITTED
+
+class PromptMetrics:
+    """Running before/after prompt sizes per route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, tokens_before, tokens_after):
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                'prompts': 0, 'trimmed': 0, 'tokens_before': 0, 'tokens_after': 0,
+                'max_tokens_before': 0
+            })
+            stats['prompts'] += 1
+            stats['trimmed'] += tokens_after < tokens_before
+            stats['tokens_before'] += tokens_before
+            stats['tokens_after'] += tokens_after
+            stats['max_tokens_before'] = max(stats['max_tokens_before'], tokens_before)
+
+    def snapshot(self):
+        with self._lock:
+            routes = {route: dict(stats) for route, stats in self._routes.items()}
+        for stats in routes.values():
+            stats['avg_tokens_before'] = round(stats['tokens_before'] / stats['prompts'], 1)
+            stats['avg_tokens_after'] = round(stats['tokens_after'] / stats['prompts'], 1)
+        return routes
+
+prompt_metrics = PromptMetrics()
+
+def recent_conversation(history, budget=PROMPT_BUDGETS['tutoring_chat'], max_messages=10):
+    """Recent turns as "Role: text" lines, newest kept first within the budget"""
+    recent = history[-max_messages:]
+    lines = []
+    used = 0
+    before = 0
+    for msg in reversed(recent):
+        line = f"{msg['role'].capitalize()}: {msg['content']}"
+        tokens = estimate_tokens(line)
+        before += tokens
+        if used >= budget:
+            continue
+        if tokens > MAX_MESSAGE_TOKENS or used + tokens > budget:
+            line = truncate_to_tokens(line, min(MAX_MESSAGE_TOKENS, budget - used))
+            tokens = estimate_tokens(line)
+        lines.append(line)
+        used += tokens
+    prompt_metrics.record('tutoring_chat', before, used)
+    return "".join(f"{line}\n" for line in reversed(lines))
+
+def first_sentence(text):
+    return _SENTENCE_END.split(text.strip(), 1)[0]
+
+def session_summary_text(history, budget=PROMPT_BUDGETS['exam_generate']):
+    """Summarize assistant turns for exam generation within a token budget.
+
+    The newest turns are kept verbatim; once they fill half the budget,
+    older turns are reduced to their first sentence, and whatever still
+    doesn't fit is dropped with a note.
+    """
+    messages = [msg['content'] for msg in history if msg['role'] == 'assistant']
+    before = sum(estimate_tokens(m) for m in messages)
+
+    kept = []
+    used = 0
+    omitted = 0
+    for content in reversed(messages):
+        tokens = estimate_tokens(content)
+        if used + tokens <= budget // 2:
+            kept.append(content)
+            used += tokens
+            continue
+        sentence = truncate_to_tokens(first_sentence(content), MAX_MESSAGE_TOKENS // 10)
+        sentence_tokens = estimate_tokens(sentence)
+        if used + sentence_tokens <= budget:
+            kept.append(sentence)
+            used += sentence_tokens
+        else:
+            omitted += 1
+
+    kept.reverse()
+    if omitted:
+        kept.insert(0, f"[{omitted} earlier explanations omitted]")
+    prompt_metrics.record('exam_generate', before, used)
+    return "\n".join(kept)
+
+def feedback_results_text(detailed_results, budget=PROMPT_BUDGETS['exam_feedback']):
+    """Compact JSON of the questions answered wrongly, for the feedback prompt.
+
+    Correct answers are summarized by count only; explanations are left
+    out because the model only needs what the student got wrong.
+    """
+    before = estimate_tokens(json.dumps(detailed_results, indent=2))
+    wrong = [{
+        "q": r['question'],
+        "answered": r['submitted_answer'] or None,
+        "correct": r['correct_answer']
+    } for r in detailed_results if not r['is_correct']]
+
+    total_wrong = len(wrong)
+    text = json.dumps(wrong, separators=(',', ':'))
+    while wrong and estimate_tokens(text) > budget:
+        wrong.pop()
+        text = json.dumps(wrong, separators=(',', ':')) + f" ({len(wrong)} of {total_wrong} shown)"
+    prompt_metrics.record('exam_feedback', before, estimate_tokens(text))
+    return text
+
+def bounded_text(route, text, keep='start'):
+    """Clip free-form caller input to the route's budget"""
+    trimmed = truncate_to_tokens(text, PROMPT_BUDGETS[route], keep=keep)
+    prompt_metrics.record(route, estimate_tokens(text), estimate_tokens(trimmed))
+    return trimmed
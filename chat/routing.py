@@ -0,0 +1,263 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .llm import generation_config, get_client, recorded_calls
+from .profiling import span
+
+# Per-endpoint model policies. Each route has a default model and
+# temperature; ``rules`` are checked in order and the first match picks the
+# model. If the chosen model's observed p95 latency exceeds
+# ``latency_budget_ms``, the route falls back to ``fallback_model``; after
+# FALLBACK_COOLDOWN_SECONDS the model's samples are dropped and it is tried
+# again, falling back anew if it is still slow.
+# Override or extend with the GEMINI_ROUTES setting (merged per route).
+DEFAULT_ROUTES = {
+    'chat': {
+        'model': 'gemini-2.5-flash',
+        'temperature': 0.7,
+        'latency_budget_ms': 4000,
+        'fallback_model': 'gemini-2.5-flash-lite',
+        'rules': [{'max_prompt_chars': 2000, 'model': 'gemini-2.5-flash-lite'}],
+    },
+    'tutoring_start': {
+        'model': 'gemini-2.5-flash',
+        'temperature': 0.7,
+        'latency_budget_ms': 6000,
+        'fallback_model': 'gemini-2.5-flash-lite',
+    },
+    'tutoring_chat': {
+        'model': 'gemini-2.5-flash',
+        'temperature': 0.7,
+        'latency_budget_ms': 6000,
+        'fallback_model': 'gemini-2.5-flash-lite',
+    },
+    'exam_generate': {
+        'model': 'gemini-2.5-flash',
+        'temperature': 0.3,
+        'latency_budget_ms': 20000,
+        'fallback_model': 'gemini-2.5-flash-lite',
+        'rules': [{'difficulty': ['hard'], 'model': 'gemini-2.5-pro'}],
+    },
+    'exam_feedback': {
+        'model': 'gemini-2.5-flash',
+        'temperature': 0.6,
+        'latency_budget_ms': 8000,
+        'fallback_model': 'gemini-2.5-flash-lite',
+    },
+    'learning_path': {
+        'model': 'gemini-2.5-flash',
+        'temperature': 0.4,
+        'latency_budget_ms': 10000,
+        'fallback_model': 'gemini-2.5-flash-lite',
+    },
+    'explain_concept': {
+        'model': 'gemini-2.5-flash',
+        'temperature': 0.6,
+        'latency_budget_ms': 8000,
+        'fallback_model': 'gemini-2.5-flash-lite',
+    },
+    # Speculative explanations (chat/prefetch.py); served as explain_concept
+    # answers, so same model, but no one is waiting on them
+    'explain_prefetch': {
+        'model': 'gemini-2.5-flash',
+        'temperature': 0.6,
+    },
+}
+
+LATENCY_WINDOW = 200        # Samples kept per (route, model)
+MIN_SAMPLES_FOR_P95 = 20    # Don't fall back on a handful of slow calls
+FALLBACK_COOLDOWN_SECONDS = 60
+DECISION_LOG_SIZE = 500
+
+@dataclass
+class RouteDecision:
+    route: str
+    model: str
+    temperature: float
+    reason: str
+    prompt_chars: int
+    latency_ms: float = None  # Set by routed_call once the call returns
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _rule_matches(rule, prompt_chars, difficulty):
+    if 'min_prompt_chars' in rule and prompt_chars < rule['min_prompt_chars']:
+        return False
+    if 'max_prompt_chars' in rule and prompt_chars > rule['max_prompt_chars']:
+        return False
+    if 'difficulty' in rule and difficulty not in rule['difficulty']:
+        return False
+    return True
+
+class ModelRouter:
+    """Pick a model per call from route policies and record observed latencies"""
+
+    def __init__(self, routes=None, clock=time.monotonic):
+        self._routes = routes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._latencies = {}  # (route, model): deque of ms
+        self._fallen_back = {}  # (route, model): when it went over budget
+        self._outcomes = {}   # (route, model): {'calls': n, 'errors': n}
+        self._in_flight = {}  # route: calls currently waiting on the model
+        self._decisions = deque(maxlen=DECISION_LOG_SIZE)
+
+    @property
+    def routes(self):
+        if self._routes is None:
+            routes = {name: dict(policy) for name, policy in DEFAULT_ROUTES.items()}
+            for name, overrides in getattr(settings, 'GEMINI_ROUTES', {}).items():
+                routes.setdefault(name, {}).update(overrides)
+            self._routes = routes
+        return self._routes
+
+    def p95(self, route, model):
+        """Observed p95 latency in ms, or None until enough samples exist"""
+        with self._lock:
+            samples = list(self._latencies.get((route, model), ()))
+        if len(samples) < MIN_SAMPLES_FOR_P95:
+            return None
+        return _percentile(samples, 0.95)
+
+    def choose(self, route, prompt_chars=0, difficulty=None):
+        policy = self.routes[route]
+        model = policy['model']
+        reason = 'default'
+        for number, rule in enumerate(policy.get('rules', [])):
+            if _rule_matches(rule, prompt_chars, difficulty):
+                model = rule['model']
+                reason = f'rule {number}'
+                break
+
+        budget = policy.get('latency_budget_ms')
+        fallback = policy.get('fallback_model')
+        if budget and fallback and fallback != model:
+            observed = self.p95(route, model)
+            if observed is not None and observed > budget:
+                if self._cooled_down(route, model):
+                    reason += '; retrying after fallback cooldown'
+                else:
+                    model = fallback
+                    reason += f'; p95 {observed:.0f}ms over {budget}ms budget'
+
+        return RouteDecision(route, model, policy.get('temperature', 0.7), reason, prompt_chars)
+
+    def _cooled_down(self, route, model):
+        """Whether a model over budget has been avoided long enough to try again.
+
+        If so its samples are dropped, so the next MIN_SAMPLES_FOR_P95 calls
+        go to it and decide afresh whether it is still too slow.
+        """
+        key = (route, model)
+        now = self._clock()
+        with self._lock:
+            since = self._fallen_back.setdefault(key, now)
+            if now - since < FALLBACK_COOLDOWN_SECONDS:
+                return False
+            del self._fallen_back[key]
+            self._latencies.pop(key, None)
+            return True
+
+    def started(self, route):
+        with self._lock:
+            self._in_flight[route] = self._in_flight.get(route, 0) + 1
+
+    def finished(self, route):
+        with self._lock:
+            self._in_flight[route] -= 1
+
+    def in_flight(self, exclude=()):
+        """Model calls currently running, across routes not in ``exclude``"""
+        with self._lock:
+            return sum(count for route, count in self._in_flight.items() if route not in exclude)
+
+    def record(self, decision, latency_ms, ok=True):
+        key = (decision.route, decision.model)
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=LATENCY_WINDOW)).append(latency_ms)
+            outcome = self._outcomes.setdefault(key, {'calls': 0, 'errors': 0})
+            outcome['calls'] += 1
+            if not ok:
+                outcome['errors'] += 1
+            self._decisions.append({
+                "route": decision.route,
+                "model": decision.model,
+                "reason": decision.reason,
+                "prompt_chars": decision.prompt_chars,
+                "latency_ms": round(latency_ms, 1),
+                "ok": ok,
+                "at": time.time()
+            })
+
+    def stats(self, recent=50):
+        """Latency percentiles per (route, model) plus the most recent decisions"""
+        with self._lock:
+            latencies = {key: list(samples) for key, samples in self._latencies.items()}
+            outcomes = {key: dict(counts) for key, counts in self._outcomes.items()}
+            decisions = list(self._decisions)[-recent:] if recent else []
+
+        models = []
+        for (route, model), samples in sorted(latencies.items()):
+            models.append({
+                "route": route,
+                "model": model,
+                "calls": outcomes[(route, model)]['calls'],
+                "errors": outcomes[(route, model)]['errors'],
+                "p50_ms": round(_percentile(samples, 0.5), 1),
+                "p95_ms": round(_percentile(samples, 0.95), 1),
+                "latency_budget_ms": self.routes.get(route, {}).get('latency_budget_ms')
+            })
+        return {"models": models, "recent_decisions": decisions}
+
+router = ModelRouter()
+
+@contextmanager
+def routed_call(route, prompt_chars, difficulty=None):
+    """Choose the model for one call on ``route`` and account for it.
+
+    The call counts as in flight (see ModelRouter.in_flight) while the
+    block runs, and its latency and outcome are recorded when it ends.
+    Cancelled calls are counted out but not recorded.
+    """
+    decision = router.choose(route, prompt_chars, difficulty)
+    start = time.perf_counter()
+    router.started(route)
+    try:
+        yield decision
+    except Exception:
+        router.record(decision, (time.perf_counter() - start) * 1000, ok=False)
+        raise
+    finally:
+        router.finished(route)
+    decision.latency_ms = (time.perf_counter() - start) * 1000
+    router.record(decision, decision.latency_ms)
+
+def generate(route, contents, system_instruction, difficulty=None):
+    """Call the model chosen for ``route`` and record how long it took"""
+    with routed_call(route, len(contents) + len(system_instruction), difficulty) as decision:
+        with span("llm_call"):
+            response = get_client().models.generate_content(
+                model=decision.model,
+                config=generation_config(
+                    system_instruction=system_instruction,
+                    temperature=decision.temperature
+                ),
+                contents=contents
+            )
+    
+    calls = recorded_calls.get()
+    if calls is not None:
+        calls.append({
+            "route": route,
+            "model": decision.model,
+            "text": response.text,
+            "latency_ms": round(decision.latency_ms, 1)
+        })
+    return response
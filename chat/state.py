@@ -0,0 +1,350 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+from collections.abc import MutableMapping
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Storage for sessions, exam results and profiles. Views see each kind as a
+# mapping of key -> record, mutate records in place and rely on the backend
+# to persist them:
+#
+# - DictBackend keeps plain dicts in this process (the original behaviour).
+# - SQLiteBackend keeps records as JSON in a WAL-mode SQLite file that every
+#   worker on the host opens. Records read inside a unit of work are cached
+#   for its duration and any that changed are written back in one
+#   transaction when it ends. StateMiddleware wraps each request in one.
+#
+# Both provide table(kind), unit_of_work(), checkpoint(), detached() and
+# updated_since(kind, since), plus a ``shared`` flag (whether other processes
+# see the same records) and ``merge_hooks`` (kind: callable run on merged
+# records). Another backend needs the same.
+
+_ENCODE = dict(separators=(',', ':'))
+# Kinds whose numbers are all counters, so concurrent changes to them add up
+# when merged; elsewhere only 'version' counters do
+COUNTER_KINDS = ('profiles',)
+
+def merge_changes(base, ours, theirs, counters=False):
+    """Three-way merge of a JSON record changed by us and by another writer.
+
+    Dicts are merged key by key and lists keep both sides' additions and
+    removals. Counters combine both sides' increments. For any other value
+    that both sides changed, ours wins.
+    """
+    if base == ours:
+        return theirs
+    if base == theirs:
+        return ours
+    if isinstance(ours, dict) and isinstance(theirs, dict):
+        base = base if isinstance(base, dict) else {}
+        merged = {}
+        for key in {**theirs, **ours}:
+            if key not in ours:
+                if key not in base:
+                    merged[key] = theirs[key]  # Added by them
+            elif key not in theirs:
+                if key not in base or ours[key] != base[key]:
+                    merged[key] = ours[key]    # Added, or changed though they removed it
+            else:
+                merged[key] = merge_changes(base.get(key), ours[key], theirs[key],
+                                            counters or key == 'version')
+        return merged
+    numbers = (int, float)
+    if (counters and isinstance(ours, numbers) and isinstance(theirs, numbers)
+            and not isinstance(ours, bool) and not isinstance(theirs, bool)):
+        return theirs + ours - (base if isinstance(base, numbers) else 0)
+    if ours != theirs and isinstance(ours, list) and isinstance(theirs, list):
+        return _merge_lists(base if isinstance(base, list) else [], ours, theirs)
+    return ours
+
+def _merge_lists(base, ours, theirs):
+    """Their list with the items we removed taken out and the ones we added appended"""
+    encode = lambda item: json.dumps(item, sort_keys=True)
+    base_counts = Counter(map(encode, base))
+    our_counts = Counter(map(encode, ours))
+    removed = base_counts - our_counts
+    added = our_counts - base_counts
+    merged = []
+    for item in theirs:
+        code = encode(item)
+        if removed[code]:
+            removed[code] -= 1
+        else:
+            merged.append(item)
+    for item in ours:
+        code = encode(item)
+        if added[code]:
+            added[code] -= 1
+            merged.append(item)
+    return merged
+
+class DictBackend:
+    shared = False
+
+    def __init__(self):
+        self._tables = {}
+        self.merge_hooks = {}  # Never called: records are shared, so nothing is merged
+
+    def table(self, kind):
+        return self._tables.setdefault(kind, {})
+
+    def unit_of_work(self):
+        return nullcontext()
+
+    def checkpoint(self):
+        pass
+
+    def detached(self):
+        return nullcontext()
+
+    def updated_since(self, kind, since):
+        return [(key, record) for key, record in list(self.table(kind).items())
+                if since is None or record.get('updated_at', '') > since]
+
+class UnitOfWork:
+    def __init__(self):
+        self.loaded = {}     # (kind, key): [record, json as read, or None if not read]
+        self.deleted = set()  # (kind, key)
+
+class SQLiteTable(MutableMapping):
+    """One kind of record in a SQLiteBackend, as a mapping"""
+
+    def __init__(self, backend, kind):
+        self.backend = backend
+        self.kind = kind
+
+    def __getitem__(self, key):
+        unit = self.backend.current_unit()
+        if unit is not None:
+            if (self.kind, key) in unit.loaded:
+                return unit.loaded[(self.kind, key)][0]
+            if (self.kind, key) in unit.deleted:
+                raise KeyError(key)
+        row = self.backend.connection().execute(
+            "SELECT data FROM state WHERE kind = ? AND key = ?", (self.kind, key)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        record = json.loads(row[0])
+        if unit is not None:
+            unit.loaded[(self.kind, key)] = [record, row[0]]
+        return record
+
+    def __contains__(self, key):
+        unit = self.backend.current_unit()
+        if unit is not None:
+            if (self.kind, key) in unit.loaded:
+                return True
+            if (self.kind, key) in unit.deleted:
+                return False
+        return self.backend.connection().execute(
+            "SELECT 1 FROM state WHERE kind = ? AND key = ?", (self.kind, key)).fetchone() is not None
+
+    def __setitem__(self, key, record):
+        unit = self.backend.current_unit()
+        if unit is None:
+            self.backend.write([(self.kind, key, json.dumps(record, **_ENCODE))])
+            return
+        unit.deleted.discard((self.kind, key))
+        # Replacing a record read in this unit still merges against what was read
+        previous = unit.loaded.get((self.kind, key))
+        unit.loaded[(self.kind, key)] = [record, previous[1] if previous else None]
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        unit = self.backend.current_unit()
+        if unit is None:
+            self.backend.write([], deletes=[(self.kind, key)])
+            return
+        unit.loaded.pop((self.kind, key), None)
+        unit.deleted.add((self.kind, key))
+
+    def __iter__(self):
+        keys = [row[0] for row in self.backend.connection().execute(
+            "SELECT key FROM state WHERE kind = ? ORDER BY key", (self.kind,))]
+        unit = self.backend.current_unit()
+        if unit is None:
+            return iter(keys)
+        stored = set(keys)
+        pending = [key for kind, key in unit.loaded if kind == self.kind and key not in stored]
+        return iter([key for key in keys if (self.kind, key) not in unit.deleted] + pending)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def clear(self):
+        unit = self.backend.current_unit()
+        if unit is not None:
+            unit.loaded = {k: v for k, v in unit.loaded.items() if k[0] != self.kind}
+            unit.deleted = {k for k in unit.deleted if k[0] != self.kind}
+        self.backend.connection().execute("DELETE FROM state WHERE kind = ?", (self.kind,))
+
+class SQLiteBackend:
+    """Records shared by all workers on a host through a WAL-mode SQLite file.
+
+    Each thread (and each forked worker) opens its own connection once and
+    reuses it. When a unit of work writes back a record that another worker
+    changed after it was read, the stored row is re-read under the write
+    lock and both changes are merged (see merge_changes), so concurrent
+    requests for the same user don't lose each other's updates.
+    """
+
+    shared = True
+
+    def __init__(self, path, timeout=5.0):
+        self.path = str(path)
+        self.timeout = timeout
+        # kind: callable fixing up a merged record in place, e.g. restoring
+        # the order of lists whose order the merge can't know
+        self.merge_hooks = {}
+        self._local = threading.local()
+        self._unit = ContextVar(f'state_unit_{id(self)}', default=None)
+        self.connection().execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (kind, key)) WITHOUT ROWID"
+        )
+        self.connection().execute(
+            "CREATE INDEX IF NOT EXISTS state_updated_at "
+            "ON state (kind, json_extract(data, '$.updated_at'))"
+        )
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # Autocommit; writes open explicit transactions in write()
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, skips an fsync per commit
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def table(self, kind):
+        return SQLiteTable(self, kind)
+
+    def current_unit(self):
+        return self._unit.get()
+
+    @contextmanager
+    def unit_of_work(self):
+        """Cache records read in this block and write back the changed ones at the end"""
+        if self._unit.get() is not None:
+            yield  # Joins the enclosing unit
+            return
+        unit = UnitOfWork()
+        token = self._unit.set(unit)
+        try:
+            yield
+        finally:
+            self._unit.reset(token)
+            self.flush(unit)
+
+    def checkpoint(self):
+        """Write back the current unit's changes now and start it afresh"""
+        unit = self._unit.get()
+        if unit is not None:
+            self.flush(unit)
+            unit.loaded.clear()
+            unit.deleted.clear()
+
+    @contextmanager
+    def detached(self):
+        """Read and write past the current unit of work for the duration of this block"""
+        token = self._unit.set(None)
+        try:
+            yield
+        finally:
+            self._unit.reset(token)
+
+    def updated_since(self, kind, since):
+        """(key, record) pairs of a kind whose updated_at is after ``since`` (None for all).
+
+        Reads the stored rows directly, through the updated_at index,
+        without loading them into any unit of work.
+        """
+        query = "SELECT key, data FROM state WHERE kind = ?"
+        params = [kind]
+        if since is not None:
+            query += " AND json_extract(data, '$.updated_at') > ?"
+            params.append(since)
+        return [(key, json.loads(data)) for key, data in self.connection().execute(query, params)]
+
+    def flush(self, unit):
+        upserts = []
+        originals = {}
+        for (kind, key), (record, original) in unit.loaded.items():
+            data = json.dumps(record, **_ENCODE)
+            if data != original:
+                upserts.append((kind, key, data))
+                originals[(kind, key)] = original
+        if upserts or unit.deleted:
+            self.write(upserts, deletes=list(unit.deleted), originals=originals)
+
+    def write(self, upserts, deletes=(), originals=None):
+        """Store (kind, key, json) upserts and delete (kind, key) pairs in one transaction.
+
+        ``originals`` maps upserted keys to the JSON they were changed from
+        (None if not read); rows that no longer match it are merged with
+        the upsert instead of overwritten.
+        """
+        upsert = ("INSERT INTO state (kind, key, data) VALUES (?, ?, ?) "
+                  "ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data")
+        conn = self.connection()
+        # IMMEDIATE takes the write lock up front, so busy waits happen here
+        # rather than failing partway through the batch
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conflicts = []
+            if originals is not None:
+                plain = []
+                for kind, key, data in upserts:
+                    stored = conn.execute("SELECT data FROM state WHERE kind = ? AND key = ?",
+                                          (kind, key)).fetchone()
+                    if stored is None or stored[0] in (originals[(kind, key)], data):
+                        plain.append((kind, key, data))
+                    else:
+                        conflicts.append((kind, key, data, originals[(kind, key)], stored[0]))
+                upserts = plain
+            conn.executemany(upsert, upserts)
+            conn.executemany("DELETE FROM state WHERE kind = ? AND key = ?", deletes)
+            # Merged last, so merge hooks can read the rest of this write
+            conn.executemany(upsert, [self._merge(*conflict) for conflict in conflicts])
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _merge(self, kind, key, data, original, stored):
+        """The upsert for a record, merged with changes stored since it was read"""
+        # Not read (e.g. created after an ``in`` check): both sides start from empty
+        base = json.loads(original) if original is not None else {}
+        merged = merge_changes(base, json.loads(data), json.loads(stored), kind in COUNTER_KINDS)
+        hook = self.merge_hooks.get(kind)
+        if hook is not None:
+            hook(merged)
+        return kind, key, json.dumps(merged, **_ENCODE)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Return the state backend selected by the STATE_BACKEND setting"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(getattr(settings, 'STATE_BACKEND', 'dict'))
+    return _backend
+
+def create_backend(name, path=None):
+    if name == 'dict':
+        return DictBackend()
+    if name == 'sqlite':
+        return SQLiteBackend(path or settings.STATE_SQLITE_PATH)
+    raise ValueError(f"Unknown STATE_BACKEND: {name}")
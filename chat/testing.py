@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+class WebSocketTestClient:
+    """Drive an ASGI WebSocket application in-process.
+
+    ``max_buffered`` bounds how many frames the fake client holds before
+    the app's sends start to block, which simulates a slow reader.
+    """
+
+    def __init__(self, application, path, max_buffered=0):
+        self.application = application
+        self.scope = {"type": "websocket", "path": path, "query_string": b"", "headers": []}
+        self._to_app = asyncio.Queue()
+        self._from_app = asyncio.Queue(maxsize=max_buffered)
+        self._task = None
+
+    async def connect(self, timeout=1):
+        """Open the connection; returns (accepted, close_code)"""
+        self._task = asyncio.ensure_future(
+            self.application(self.scope, self._to_app.get, self._from_app.put))
+        await self._to_app.put({"type": "websocket.connect"})
+        message = await self.receive_message(timeout)
+        return message["type"] == "websocket.accept", message.get("code")
+
+    async def receive_message(self, timeout=1):
+        """Next raw ASGI message sent by the app"""
+        return await asyncio.wait_for(self._from_app.get(), timeout)
+
+    async def send_json(self, data):
+        await self._to_app.put({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive_json(self, timeout=1):
+        message = await self.receive_message(timeout)
+        if message["type"] != "websocket.send":
+            raise AssertionError(f"Expected a frame, got {message}")
+        return json.loads(message["text"])
+
+    async def receive_until(self, frame_type, timeout=1):
+        """Collect frames up to and including the first one of ``frame_type``"""
+        frames = []
+        while True:
+            frame = await self.receive_json(timeout)
+            frames.append(frame)
+            if frame.get("type") == frame_type:
+                return frames
+
+    async def disconnect(self, timeout=1):
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        if self._task:
+            await asyncio.wait_for(self._task, timeout)
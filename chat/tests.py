@@ -1,3 +1,885 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.test import Client, SimpleTestCase, override_settings
+
+from . import llm, views
+from .analytics import AnswerStore
+from .dedup import QuestionIndex, minhash_signature
+from .events import session_events
+from .fake_llm import RecordedClient
+from .llm import install_client, reset_client
+from .pagination import PaginationError, paginate_by_time
+from .prefetch import ExplanationCache, NextConceptsFilter, Prefetcher, explanation_cache, extract_next_concepts, prefetcher
+from .prompts import PROMPT_BUDGETS, estimate_tokens, feedback_results_text, recent_conversation, session_summary_text
+from .routing import DEFAULT_ROUTES, FALLBACK_COOLDOWN_SECONDS, MIN_SAMPLES_FOR_P95, ModelRouter, router
+from .state import SQLiteBackend, merge_changes
+from .testing import WebSocketTestClient
+from .traffic import REDACTED, TrafficLog, read_log, replay, sanitize
+from .websocket import CLOSE_NOT_FOUND, CLOSE_SLOW_CONSUMER, MAX_PENDING_MESSAGES, tutoring_websocket
+
+
+@override_settings(GEMINI_BACKEND='fake')
+class TutoringWebSocketTests(SimpleTestCase):
+
+    def setUp(self):
+        reset_client()
+        views.request_counter = 0
+        self.http = Client()
+        response = self.http.post('/api/tutoring/start/', {'user_id': 'ws-user', 'topic': 'Algebra'},
+                                  content_type='application/json')
+        self.session_id = response.json()['session_id']
+
+    def tearDown(self):
+        reset_client()
+
+    def run_async(self, coroutine):
+        return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+    def test_unknown_session_is_rejected(self):
+        async def scenario():
+            ws = WebSocketTestClient(tutoring_websocket, '/ws/tutoring/missing/')
+            return await ws.connect()
+
+        self.assertEqual(self.run_async(scenario()), (False, CLOSE_NOT_FOUND))
+
+    def test_message_streams_tokens_then_reply(self):
+        async def scenario():
+            ws = WebSocketTestClient(tutoring_websocket, f'/ws/tutoring/{self.session_id}/')
+            accepted, _ = await ws.connect()
+            self.assertTrue(accepted)
+            await ws.send_json({'type': 'message', 'content': 'What is a variable?'})
+            frames = await ws.receive_until('reply')
+            await ws.disconnect()
+            return frames
+
+        frames = self.run_async(scenario())
+        tokens = [f['content'] for f in frames if f['type'] == 'token']
+        reply = frames[-1]
+        self.assertGreater(len(tokens), 1)
+        # The fake reply ends with a "Next concepts:" line, which is never streamed
+        self.assertEqual(''.join(tokens), reply['reply'])
+        self.assertNotIn('Next concepts', ''.join(tokens))
+        self.assertEqual(reply['next_concepts'], ['Worked examples', 'Practice problems'])
+        history = views.tutoring_sessions[self.session_id]['conversation_history']
+        self.assertEqual([m['role'] for m in history[-2:]], ['user', 'assistant'])
+
+    def test_streamed_turn_counts_as_in_flight(self):
+        release = asyncio.Event()
+
+        async def slow_stream(**kwargs):
+            async def stream():
+                yield SimpleNamespace(text='Thinking')
+                await release.wait()
+                yield SimpleNamespace(text=' done.')
+            return stream()
+
+        install_client(SimpleNamespace(aio=SimpleNamespace(
+            models=SimpleNamespace(generate_content_stream=slow_stream))))
+        baseline = router.in_flight()
+
+        async def scenario():
+            ws = WebSocketTestClient(tutoring_websocket, f'/ws/tutoring/{self.session_id}/')
+            await ws.connect()
+            await ws.send_json({'type': 'message', 'content': 'Explain slowly'})
+            first = await ws.receive_json()
+            during = router.in_flight()
+            release.set()
+            frames = await ws.receive_until('reply')
+            await ws.disconnect()
+            return first, during, frames
+
+        first, during, frames = self.run_async(scenario())
+        self.assertEqual(first, {'type': 'token', 'content': 'Thinking'})
+        self.assertEqual(during, baseline + 1)
+        self.assertEqual(frames[-1]['reply'], 'Thinking done.')
+        self.assertEqual(router.in_flight(), baseline)
+
+    def test_exam_and_feedback_events_are_pushed(self):
+        async def scenario():
+            ws = WebSocketTestClient(tutoring_websocket, f'/ws/tutoring/{self.session_id}/')
+            await ws.connect()
+            response = await asyncio.to_thread(
+                self.http.post, '/api/exam/generate/', {'session_id': self.session_id, 'num_questions': 2},
+                content_type='application/json')
+            exam_id = response.json()['exam_id']
+            exam_ready = await ws.receive_json()
+            await asyncio.to_thread(
+                self.http.post, '/api/exam/submit/', {'exam_id': exam_id, 'answers': {'1': 'A', '2': 'B'}},
+                content_type='application/json')
+            feedback_ready = await ws.receive_json()
+            await ws.disconnect()
+            return exam_id, exam_ready, feedback_ready
+
+        exam_id, exam_ready, feedback_ready = self.run_async(scenario())
+        self.assertEqual(exam_ready['type'], 'exam_ready')
+        self.assertEqual(exam_ready['exam']['exam_id'], exam_id)
+        self.assertEqual(feedback_ready['type'], 'feedback_ready')
+        self.assertEqual(feedback_ready['score'], 50.0)
+
+    def test_slow_consumer_is_disconnected(self):
+        async def scenario():
+            ws = WebSocketTestClient(tutoring_websocket, f'/ws/tutoring/{self.session_id}/', max_buffered=1)
+            await ws.connect()
+            for number in range(MAX_PENDING_MESSAGES + 5):
+                session_events.publish(self.session_id, {'type': 'exam_ready', 'number': number})
+            await asyncio.sleep(0.05)
+            messages = []
+            while True:
+                message = await ws.receive_message()
+                messages.append(message)
+                if message['type'] == 'websocket.close':
+                    break
+            await ws.disconnect()
+            return messages
+
+        messages = self.run_async(scenario())
+        self.assertEqual(messages[-1]['code'], CLOSE_SLOW_CONSUMER)
+        self.assertLess(len(messages), MAX_PENDING_MESSAGES + 5)
+
+
+class LazyClientTests(SimpleTestCase):
+
+    def tearDown(self):
+        reset_client()
+
+    def test_importing_views_does_not_load_the_sdk(self):
+        script = ("import sys, django; django.setup(); import chat.views; "
+                  "print(sorted({'google.genai', 'dotenv'} & set(sys.modules)))")
+        env = {key: value for key, value in os.environ.items() if key != 'GEMINI_API_KEY'}
+        env['DJANGO_SETTINGS_MODULE'] = 'gemini_chatbot.settings'
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_concurrent_first_calls_build_one_client(self):
+        reset_client()
+        barrier = threading.Barrier(8)
+        clients = []
+
+        def create():
+            time.sleep(0.05)  # Let the other threads pile up behind the first
+            return object()
+
+        def call():
+            barrier.wait()
+            clients.append(llm.get_client())
+
+        with mock.patch.object(llm, '_create_client', side_effect=create) as create_client:
+            threads = [threading.Thread(target=call) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(create_client.call_count, 1)
+        self.assertEqual(len({id(client) for client in clients}), 1)
+
+
+class ModelRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ModelRouter(routes={
+            'exam': {
+                'model': 'primary',
+                'temperature': 0.3,
+                'latency_budget_ms': 100,
+                'fallback_model': 'fast',
+                'rules': [{'difficulty': ['hard'], 'model': 'strong'}],
+            },
+        })
+
+    def test_rules_pick_model_by_difficulty(self):
+        self.assertEqual(self.router.choose('exam', difficulty='hard').model, 'strong')
+        decision = self.router.choose('exam', difficulty='easy')
+        self.assertEqual((decision.model, decision.temperature), ('primary', 0.3))
+
+    def test_default_routes_fall_back_to_a_different_model(self):
+        for name, route in DEFAULT_ROUTES.items():
+            if 'fallback_model' in route:
+                self.assertNotEqual(route['fallback_model'], route['model'], name)
+
+    def test_falls_back_when_p95_exceeds_budget(self):
+        decision = self.router.choose('exam')
+        for _ in range(MIN_SAMPLES_FOR_P95):
+            self.router.record(decision, 50)
+        self.assertEqual(self.router.choose('exam').model, 'primary')
+        for _ in range(MIN_SAMPLES_FOR_P95):
+            self.router.record(decision, 500)
+        self.assertEqual(self.router.choose('exam').model, 'fast')
+
+    def test_retries_primary_after_cooldown(self):
+        now = [1000.0]
+        router = ModelRouter(routes=self.router.routes, clock=lambda: now[0])
+        slow = router.choose('exam')
+        for _ in range(MIN_SAMPLES_FOR_P95):
+            router.record(slow, 500)
+        self.assertEqual(router.choose('exam').model, 'fast')
+        now[0] += FALLBACK_COOLDOWN_SECONDS / 2
+        self.assertEqual(router.choose('exam').model, 'fast')
+
+        # The cooldown passes: the primary gets fresh samples and, now fast, keeps the route
+        now[0] += FALLBACK_COOLDOWN_SECONDS
+        retry = router.choose('exam')
+        self.assertEqual(retry.model, 'primary')
+        for _ in range(MIN_SAMPLES_FOR_P95):
+            router.record(retry, 50)
+        self.assertEqual(router.choose('exam').model, 'primary')
+
+        # Still slow after a retry: it falls back again
+        for _ in range(MIN_SAMPLES_FOR_P95):
+            router.record(retry, 500)
+        self.assertEqual(router.choose('exam').model, 'fast')
+
+
+class PromptBudgetTests(SimpleTestCase):
+
+    def test_long_history_is_kept_within_budget(self):
+        history = [{'role': 'assistant', 'content': 'Limits describe behaviour. ' + 'detail ' * 2000}
+                   for _ in range(20)]
+        summary = session_summary_text(history, budget=1000)
+        context = recent_conversation(history, budget=1000)
+        self.assertLessEqual(estimate_tokens(summary), 1000)
+        self.assertLessEqual(estimate_tokens(context), 1000)
+        self.assertIn('Limits describe behaviour.', summary)
+
+    def test_feedback_lists_only_wrong_answers(self):
+        results = [
+            {'question': 'Q1?', 'submitted_answer': 'A', 'correct_answer': 'A',
+             'is_correct': True, 'explanation': 'because'},
+            {'question': 'Q2?', 'submitted_answer': '', 'correct_answer': 'C',
+             'is_correct': False, 'explanation': 'because'},
+        ]
+        self.assertEqual(feedback_results_text(results),
+                         '[{"q":"Q2?","answered":null,"correct":"C"}]')
+
+    def test_session_lists_are_bounded_in_tutoring_prompt(self):
+        session = {
+            'topic': 'Algebra',
+            'difficulty_level': 'beginner',
+            'conversation_history': [],
+            'learning_objectives': [f'objective {n}' for n in range(2000)],
+            'concepts_covered': [f'concept {n}' for n in range(2000)],
+        }
+        instruction, _ = views.build_tutoring_prompt(session)
+        budget = PROMPT_BUDGETS['session_objectives'] + PROMPT_BUDGETS['session_concepts']
+        self.assertLess(estimate_tokens(instruction), budget + 300)
+        self.assertIn('objective 0,', instruction)
+        self.assertIn('concept 1999', instruction)
+
+
+@override_settings(GEMINI_BACKEND='fake')
+class TrafficReplayTests(SimpleTestCase):
+
+    def tearDown(self):
+        reset_client()
+
+    def test_sanitize_redacts_nested_secrets(self):
+        self.assertEqual(sanitize({'user': {'password': 'x', 'name': 'a'}, 'items': [{'token': 't'}]}),
+                         {'user': {'password': REDACTED, 'name': 'a'}, 'items': [{'token': REDACTED}]})
+
+    def test_replay_remaps_ids_and_serves_recorded_replies(self):
+        views.request_counter = 0
+        client = RecordedClient()
+        install_client(client)
+        entries = [
+            {'ts': 0, 'method': 'POST', 'path': '/api/tutoring/start/', 'query': '',
+             'request': {'user_id': 'replay-user', 'topic': 'Sets'}, 'status': 200, 'duration_ms': 5,
+             'response': {'session_id': 'recorded-session'}, 'llm_calls': [{'text': 'Welcome'}]},
+            {'ts': 0, 'method': 'POST', 'path': '/api/tutoring/chat/', 'query': '',
+             'request': {'session_id': 'recorded-session', 'message': 'Is recorded-session an ID?'}, 'status': 200,
+             'duration_ms': 5, 'response': {}, 'llm_calls': [{'text': 'Recorded answer'}]},
+        ]
+
+        report = replay(entries, Client(), speed=0, on_request=lambda e: client.prime(e['llm_calls']))
+        self.assertEqual(report['total']['requests'], 2)
+        self.assertEqual(report['total']['status_mismatches'], 0)
+        session = next(s for s in views.tutoring_sessions.values() if s['user_id'] == 'replay-user')
+        self.assertEqual(session['conversation_history'][-1]['content'], 'Recorded answer')
+        # Only ID fields are remapped, not IDs mentioned in free text
+        self.assertEqual(session['conversation_history'][-2]['content'], 'Is recorded-session an ID?')
+
+    def test_recorded_headers_and_gzip_bodies_replay_faithfully(self):
+        views.request_counter = 0
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'traffic.jsonl')
+        with override_settings(TRAFFIC_RECORDING=True, TRAFFIC_LOG_PATH=path):
+            http = Client()
+            session_id = http.post('/api/tutoring/start/', {'user_id': 'header-user', 'topic': 'Sets'},
+                                   content_type='application/json').json()['session_id']
+            progress = f'/api/tutoring/session/{session_id}/progress/'
+            etag = http.get(progress)['ETag']
+            self.assertEqual(http.get(progress, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            record = {'type': 'session', 'id': 'imported-session',
+                      'data': dict(views.tutoring_sessions[session_id], session_id='imported-session')}
+            http.post('/api/import/', gzip.compress(json.dumps(record).encode()),
+                      content_type='application/x-ndjson', HTTP_CONTENT_ENCODING='gzip')
+            deadline = time.monotonic() + 5
+            while len(list(read_log(path))) < 4 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        entries = list(read_log(path))
+        self.assertEqual(entries[2]['headers'], {'If-None-Match': etag})
+        self.assertEqual(entries[3]['request'], {'_ndjson': [json.loads(json.dumps(record))]})
+        report = replay(entries, Client(), speed=0)
+        self.assertEqual(report['total']['status_mismatches'], 0)
+        self.assertEqual(report['endpoints']['GET session_progress']['requests'], 2)
+
+    def test_log_lines_from_concurrent_writers_stay_whole(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'traffic.jsonl')
+        logs = [TrafficLog(path) for _ in range(4)]
+        for number in range(200):
+            for writer, log in enumerate(logs):
+                log.append({'writer': writer, 'number': number, 'padding': 'x' * 5000})
+        for log in logs:
+            log.flush()
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 800)
+        self.assertEqual(len([json.loads(line) for line in lines]), 800)
+
+
+@override_settings(GEMINI_BACKEND='fake', PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0,
+                   PROFILING_SLOW_MS=0, PROFILING_MAX_REPORTS=2)
+class ProfilingMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        reset_client()
+        views.request_counter = 0
+        self.report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.report_dir)
+        self.enterContext(override_settings(PROFILING_REPORT_DIR=self.report_dir))
+
+    def start_session(self, **headers):
+        return Client().post('/api/tutoring/start/', {'user_id': 'prof-user', 'topic': 'Graphs'},
+                             content_type='application/json', headers=headers)
+
+    def test_unsampled_requests_are_not_profiled(self):
+        response = self.start_session()
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(os.listdir(self.report_dir), [])
+
+    def test_forced_request_reports_phases_and_rotates(self):
+        for _ in range(3):
+            response = self.start_session(**{'X-Profile': '1'})
+        self.assertIn('llm_call;dur=', response['Server-Timing'])
+        reports = sorted(os.listdir(self.report_dir))
+        self.assertEqual(len(reports), 2)
+        with open(os.path.join(self.report_dir, reports[-1])) as f:
+            report = json.load(f)
+        self.assertEqual(report['path'], '/api/tutoring/start/')
+        self.assertIn('serialize', report['phases'])
+
+
+STATE_WORKERS = 4
+SESSIONS_PER_WORKER = 25
+
+def _state_worker(path, number, barrier):
+    backend = SQLiteBackend(path)
+    sessions = backend.table('sessions')
+    for i in range(SESSIONS_PER_WORKER):
+        with backend.unit_of_work():
+            sessions[f"{number}-{i}"] = {'owner': number, 'messages': []}
+    barrier.wait(timeout=30)
+    # Then update the sessions another worker created, concurrently with the others
+    target = (number + 1) % STATE_WORKERS
+    for i in range(SESSIONS_PER_WORKER):
+        with backend.unit_of_work():
+            sessions[f"{target}-{i}"]['messages'].append(number)
+
+def _profile_worker(path, number, barrier):
+    backend = SQLiteBackend(path)
+    profiles = backend.table('profiles')
+    barrier.wait(timeout=30)
+    # Every worker creates the same profile, as concurrent first requests would
+    with backend.unit_of_work():
+        if 'shared' not in profiles:
+            profiles['shared'] = {'sessions': [], 'stats': {'session_count': 0}, 'version': 1}
+    for i in range(SESSIONS_PER_WORKER):
+        with backend.unit_of_work():
+            profile = profiles['shared']
+            profile['sessions'].append(f"{number}-{i}")
+            profile['stats']['session_count'] += 1
+            profile['version'] += 1
+            profile['last_writer'] = number
+
+
+class SQLiteStateTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'state.sqlite3')
+
+    def test_unit_of_work_writes_back_changed_records(self):
+        backend = SQLiteBackend(self.path)
+        sessions = backend.table('sessions')
+        sessions['s1'] = {'messages': []}
+        with backend.unit_of_work():
+            sessions['s1']['messages'].append('hi')
+            self.assertIs(sessions['s1'], sessions['s1'])
+        self.assertEqual(SQLiteBackend(self.path).table('sessions')['s1'], {'messages': ['hi']})
+
+    def test_workers_share_sessions(self):
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(STATE_WORKERS)
+        workers = [context.Process(target=_state_worker, args=(self.path, n, barrier))
+                   for n in range(STATE_WORKERS)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=60)
+        self.assertEqual([worker.exitcode for worker in workers], [0] * STATE_WORKERS)
+
+        sessions = SQLiteBackend(self.path).table('sessions')
+        self.assertEqual(len(sessions), STATE_WORKERS * SESSIONS_PER_WORKER)
+        for key in sessions:
+            owner = sessions[key]['owner']
+            self.assertEqual(sessions[key]['messages'], [(owner - 1) % STATE_WORKERS])
+
+    def test_concurrent_changes_to_one_record_are_merged(self):
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(STATE_WORKERS)
+        workers = [context.Process(target=_profile_worker, args=(self.path, n, barrier))
+                   for n in range(STATE_WORKERS)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=60)
+        self.assertEqual([worker.exitcode for worker in workers], [0] * STATE_WORKERS)
+
+        profile = SQLiteBackend(self.path).table('profiles')['shared']
+        total = STATE_WORKERS * SESSIONS_PER_WORKER
+        self.assertEqual(sorted(profile['sessions']),
+                         sorted(f"{n}-{i}" for n in range(STATE_WORKERS) for i in range(SESSIONS_PER_WORKER)))
+        self.assertEqual(profile['stats']['session_count'], total)
+        self.assertGreaterEqual(profile['version'], total + 1)
+        self.assertIn(profile['last_writer'], range(STATE_WORKERS))
+
+    def test_merged_profile_history_stays_in_time_order(self):
+        ours_backend, their_backend = SQLiteBackend(self.path), SQLiteBackend(self.path)
+        for backend in (ours_backend, their_backend):
+            backend.merge_hooks['profiles'] = views.restore_history_order
+        sessions = ours_backend.table('sessions')
+        for session_id, created_at in (('s0', '2026-01-01T00:00:00'), ('sA', '2026-01-02T00:00:00'),
+                                       ('sB', '2026-01-03T00:00:00')):
+            sessions[session_id] = {'created_at': created_at}
+        ours_backend.table('profiles')['u'] = {
+            'sessions': ['s0'], 'sessions_by_topic': {'Sets': ['s0']},
+            'graded_exams': [], 'exams_by_topic': {}, 'version': 1}
+
+        with mock.patch.object(views, 'tutoring_sessions', sessions), \
+                mock.patch.object(views, 'exam_results', ours_backend.table('exams')):
+            # Two requests add a session each; the later-created one commits first
+            with ours_backend.unit_of_work():
+                profile = ours_backend.table('profiles')['u']
+                with their_backend.unit_of_work():
+                    theirs = their_backend.table('profiles')['u']
+                    theirs['sessions'].append('sB')
+                    theirs['sessions_by_topic']['Sets'].append('sB')
+                profile['sessions'].append('sA')
+                profile['sessions_by_topic']['Sets'].append('sA')
+
+        profile = SQLiteBackend(self.path).table('profiles')['u']
+        self.assertEqual(profile['sessions'], ['s0', 'sA', 'sB'])
+        self.assertEqual(profile['sessions_by_topic']['Sets'], ['s0', 'sA', 'sB'])
+        created_at = lambda session_id: sessions[session_id]['created_at']
+        walked, cursor = [], None
+        while True:
+            page, cursor = paginate_by_time(profile['sessions'], created_at, 1, cursor=cursor)
+            walked += page
+            if cursor is None:
+                break
+        self.assertEqual(walked, ['sB', 'sA', 's0'])
+        self.assertEqual(paginate_by_time(profile['sessions'], created_at, 5, since='2026-01-03')[0], ['sB'])
+
+    def test_merge_keeps_both_sides(self):
+        base = {'history': ['a'], 'count': 1, 'status': 'active', 'version': 2}
+        ours = {'history': ['a', 'b'], 'count': 2, 'status': 'done', 'version': 3}
+        theirs = {'history': ['a', 'c'], 'count': 3, 'status': 'paused', 'version': 3, 'extra': 1}
+        self.assertEqual(merge_changes(base, ours, theirs),
+                         {'history': ['a', 'c', 'b'], 'count': 2, 'status': 'done', 'version': 4, 'extra': 1})
+        self.assertEqual(merge_changes(base, ours, theirs, counters=True)['count'], 4)
+
+
+@override_settings(GEMINI_BACKEND='fake', PREFETCH_ENABLED=True)
+class PrefetchTests(SimpleTestCase):
+
+    def setUp(self):
+        reset_client()
+        views.request_counter = 0
+        explanation_cache.clear()
+        prefetcher.reset()
+        self.addCleanup(reset_client)
+
+    def test_extracts_next_concepts(self):
+        reply, concepts = extract_next_concepts("Nice work.\nNext concepts: Limits, the Chain rule")
+        self.assertEqual((reply, concepts), ("Nice work.", ["Limits", "Chain rule"]))
+        self.assertEqual(extract_next_concepts("Next, we'll explore derivatives.")[1], ["derivatives"])
+
+    def test_streamed_marker_line_is_held_back(self):
+        text = "Limits describe behaviour.\nNext steps are easy.\n\n**Next concepts:** Limits, Chain rule\n"
+        for size in (1, 2, 5, 13):
+            visible = NextConceptsFilter()
+            shown = [visible.feed(text[i:i + size]) for i in range(0, len(text), size)]
+            self.assertEqual(''.join(shown) + visible.finish(), extract_next_concepts(text.strip())[0])
+
+    def test_prefetched_explanation_is_served_from_cache(self):
+        http = Client()
+        session_id = http.post('/api/tutoring/start/', {'user_id': 'pf-user', 'topic': 'Calculus'},
+                               content_type='application/json').json()['session_id']
+        client = RecordedClient()
+        client.prime([{'text': 'Good.\nNext concepts: Limits, Chain rule'}])
+        install_client(client)
+
+        reply = http.post('/api/tutoring/chat/', {'session_id': session_id, 'message': 'done'},
+                          content_type='application/json').json()
+        self.assertEqual(reply['reply'], 'Good.')
+        self.assertEqual(reply['next_concepts'], ['Limits', 'Chain rule'])
+        prefetcher.wait_idle()
+
+        explained = http.post('/api/learning/explain/', {'session_id': session_id, 'concept': 'limits'},
+                              content_type='application/json').json()
+        self.assertTrue(explained['cached'])
+        stats = prefetcher.stats()
+        self.assertEqual((stats['completed'], stats['cache']['prefetch_hits']), (2, 1))
+
+    @override_settings(PREFETCH_WORKERS=1)
+    def test_new_reply_cancels_stale_speculation(self):
+        cache = ExplanationCache()
+        speculator = Prefetcher(cache)
+        release = threading.Event()
+        speculator.schedule('s1', [('a', lambda: release.wait(5) and 'A'), ('b', lambda: 'B')])
+        speculator.schedule('s1', [('c', lambda: 'C')])
+        release.set()
+        speculator.wait_idle()
+        self.assertNotIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(speculator.stats()['cancelled'], 2)
+
+
+class QuestionDedupTests(SimpleTestCase):
+
+    def setUp(self):
+        self.original = {'question': 'What is the derivative of x squared with respect to x?',
+                         'options': ['A) 2x', 'B) x', 'C) x^2', 'D) 2']}
+        self.index = QuestionIndex()
+        self.index.insert('u1', 'exam1:1', minhash_signature(self.original))
+
+    def test_reworded_question_is_dropped(self):
+        reworded = {'question': 'Which is the derivative of x squared with respect to x?',
+                    'options': ['A) x', 'B) 2x', 'C) 2', 'D) x^2']}
+        unrelated = {'question': 'Which organelle produces ATP in the cell?',
+                     'options': ['A) Mitochondria', 'B) Nucleus', 'C) Ribosome', 'D) Golgi']}
+        unique, duplicates = self.index.filter_new_questions('u1', [reworded, unrelated])
+        self.assertEqual(duplicates, [reworded])
+        self.assertEqual([q for q, _ in unique], [unrelated])
+        # Other users' histories are not compared against
+        self.assertEqual(self.index.filter_new_questions('u2', [reworded])[1], [])
+
+    def test_index_stays_within_bounds(self):
+        index = QuestionIndex(max_items=10, max_per_scope=4)
+        for n in range(6):
+            index.insert('u1', f'e:{n}', minhash_signature({'question': f'Question number {n} here'}))
+        self.assertEqual(len(index), 4)
+        self.assertIsNone(index.query('u1', minhash_signature({'question': 'Question number 0 here'})))
+        for n in range(12):
+            index.insert(f'user{n}', f'e:{n}', minhash_signature({'question': f'Other question {n}'}))
+        self.assertLessEqual(len(index), 10)
+
+    def test_removed_and_reinserted_questions_keep_their_keys(self):
+        index = QuestionIndex(max_per_scope=3)
+        question = lambda n: {'question': f'Question number {n} about a different topic {n * 7}'}
+        for n in range(4):
+            index.insert('u1', f'e:{n}', minhash_signature(question(n)))
+        index.remove('u1', 'e:2')
+        index.insert('u1', 'e:1', minhash_signature(question(1)))
+        index.insert('u1', 'e:4', minhash_signature(question(4)))
+        self.assertEqual(len(index), 3)
+        for n, key in ((0, None), (1, 'e:1'), (2, None), (3, 'e:3'), (4, 'e:4')):
+            self.assertEqual(index.query('u1', minhash_signature(question(n))), key)
+
+
+@override_settings(GEMINI_BACKEND='fake')
+class ConditionalGetTests(SimpleTestCase):
+
+    def setUp(self):
+        reset_client()
+        views.request_counter = 0
+        self.http = Client()
+
+    def start_session(self, user_id):
+        return self.http.post('/api/tutoring/start/', {'user_id': user_id, 'topic': 'Optics'},
+                              content_type='application/json').json()['session_id']
+
+    def test_matching_etag_gets_304_until_the_record_changes(self):
+        session_id = self.start_session('etag-user')
+        url = f'/api/tutoring/session/{session_id}/progress/'
+        etag = self.http.get(url)['ETag']
+        self.assertEqual(self.http.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        self.http.post('/api/tutoring/chat/', {'session_id': session_id, 'message': 'more please'},
+                       content_type='application/json')
+        response = self.http.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_recreated_profile_does_not_match_old_etag(self):
+        self.start_session('restart-user')
+        url = '/api/user/restart-user/profile/'
+        etag = self.http.get(url)['ETag']
+        del views.user_profiles['restart-user']  # As after a restart
+        self.start_session('restart-user')
+        self.assertEqual(self.http.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+
+@override_settings(GEMINI_BACKEND='fake')
+class PaginationTests(SimpleTestCase):
+
+    times = {'a': '2026-01-01T09:00:00', 'b': '2026-01-02T09:00:00', 'c': '2026-01-02T09:00:00',
+             'd': '2026-01-02T09:00:00', 'e': '2026-01-03T09:00:00'}
+
+    def pages(self, **filters):
+        ids = sorted(self.times, key=self.times.get)
+        pages, cursor = [], None
+        while True:
+            page, cursor = paginate_by_time(ids, self.times.get, 2, cursor=cursor, **filters)
+            pages.append(page)
+            if cursor is None:
+                return pages
+
+    def test_cursor_walks_through_shared_timestamps(self):
+        self.assertEqual(self.pages(), [['e', 'd'], ['c', 'b'], ['a']])
+
+    def test_since_until_bound_the_range(self):
+        self.assertEqual(self.pages(since='2026-01-02', until='2026-01-03'), [['d', 'c'], ['b']])
+        with self.assertRaises(PaginationError):
+            paginate_by_time(['a'], self.times.get, 2, since='last tuesday')
+
+    def test_history_endpoint_pages_and_rejects_bad_bounds(self):
+        reset_client()
+        views.request_counter = 0
+        http = Client()
+        for topic in ('Sets', 'Logic', 'Graphs'):
+            http.post('/api/tutoring/start/', {'user_id': 'page-user', 'topic': topic},
+                      content_type='application/json')
+        first = http.get('/api/user/page-user/sessions/?limit=2').json()
+        second = http.get(f"/api/user/page-user/sessions/?limit=2&cursor={first['next_cursor']}").json()
+        topics = [s['topic'] for s in first['sessions'] + second['sessions']]
+        self.assertEqual(topics, ['Graphs', 'Logic', 'Sets'])
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(http.get('/api/user/page-user/sessions/?since=soon').status_code, 400)
+
+
+@override_settings(GEMINI_BACKEND='fake')
+class ExportImportTests(SimpleTestCase):
+
+    def setUp(self):
+        reset_client()
+        views.request_counter = 0
+        self.http = Client()
+
+    def post(self, path, data):
+        return self.http.post(path, data, content_type='application/json').json()
+
+    def test_round_trip_rebuilds_history_and_aggregates(self):
+        session_ids = [self.post('/api/tutoring/start/', {'user_id': 'export-user', 'topic': topic})['session_id']
+                       for topic in ('Algebra', 'Geometry')]
+        exam_id = self.post('/api/exam/generate/', {'session_id': session_ids[0], 'num_questions': 2})['exam_id']
+        self.post('/api/exam/submit/', {'exam_id': exam_id, 'answers': {'1': 'A', '2': 'B'}})
+        before = self.http.get('/api/user/export-user/profile/?summary=1').json()
+
+        response = self.http.get('/api/export/')
+        self.assertTrue(response['X-Export-Cursor'])
+        lines = [line for line in b''.join(response.streaming_content).splitlines()
+                 if json.loads(line)['id'] in session_ids + [exam_id]]
+        self.assertEqual(len(lines), 3)
+
+        for session_id in session_ids:
+            del views.tutoring_sessions[session_id]
+        del views.exam_results[exam_id]
+        del views.user_profiles['export-user']
+
+        body = gzip.compress(b'\n'.join(lines))
+        result = self.http.post('/api/import/', body, content_type='application/x-ndjson',
+                                HTTP_CONTENT_ENCODING='gzip').json()
+        self.assertEqual(result['imported'], {'sessions': 2, 'exams': 1})
+        after = self.http.get('/api/user/export-user/profile/?summary=1').json()
+        self.assertEqual(after['summary'], before['summary'])
+
+        # Records re-sent by an overlapping export overwrite rather than add up
+        self.http.post('/api/import/', b'\n'.join(lines), content_type='application/x-ndjson')
+        again = self.http.get('/api/user/export-user/profile/?summary=1').json()
+        self.assertEqual(again['summary'], before['summary'])
+
+    def test_bad_record_rejects_batch_and_reimport_repairs_profiles(self):
+        def session(session_id, drop=()):
+            data = {'session_id': session_id, 'user_id': 'import-user', 'topic': 'Sets',
+                    'created_at': f'2026-01-0{session_id[-1]}T09:00:00',
+                    'updated_at': '2026-01-09T09:00:00', 'conversation_history': [],
+                    'learning_objectives': [], 'concepts_covered': [], 'difficulty_level': 'beginner',
+                    'status': 'active'}
+            for field in drop:
+                del data[field]
+            return json.dumps({'type': 'session', 'id': session_id, 'data': data})
+
+        response = self.http.post('/api/import/', '\n'.join([session('import-s1', drop=['user_id']),
+                                                             session('import-s2')]),
+                                  content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('user_id', response.json()['error'])
+        self.assertNotIn('import-s2', views.tutoring_sessions)
+
+        # Stored by an earlier, interrupted import but never attached to the profile
+        views.tutoring_sessions['import-s1'] = json.loads(session('import-s1'))['data']
+        result = self.http.post('/api/import/', '\n'.join([session('import-s1'), session('import-s2')]),
+                                content_type='application/x-ndjson').json()
+        self.assertEqual(result['imported'], {'sessions': 2, 'exams': 0})
+        listed = self.http.get('/api/user/import-user/sessions/').json()['sessions']
+        self.assertEqual([s['session_id'] for s in listed], ['import-s2', 'import-s1'])
+
+    def test_import_signs_only_questions_the_index_keeps(self):
+        session_id = self.post('/api/tutoring/start/', {'user_id': 'index-user', 'topic': 'Sets'})['session_id']
+        records = [{'type': 'session', 'id': session_id, 'data': views.tutoring_sessions[session_id]}]
+        for number in range(4):
+            questions = [{'question_id': q, 'question': f'Question {number}.{q} about sets?',
+                          'options': ['A) yes', 'B) no'], 'correct_answer': 'A'} for q in (1, 2)]
+            records.append({'type': 'exam', 'id': f'index-exam-{number}', 'data': {
+                'exam_data': {'session_id': session_id, 'topic': 'Sets', 'questions': questions},
+                'score': 50.0, 'graded_at': f'2026-02-0{number + 1}T09:00:00',
+                'updated_at': f'2026-02-0{number + 1}T09:00:00', 'detailed_results': []}})
+
+        index = QuestionIndex(max_per_scope=4)
+        with mock.patch.object(views, 'question_index', index), \
+                mock.patch.object(views, 'minhash_signature', wraps=minhash_signature) as sign:
+            views.import_records(iter(records), batch_size=2)
+        self.assertEqual(sign.call_count, 4)
+        self.assertEqual(index._scopes['index-user'].keys,
+                         ['index-exam-2:1', 'index-exam-2:2', 'index-exam-3:1', 'index-exam-3:2'])
+
+    def test_export_rejects_invalid_since(self):
+        self.assertEqual(self.http.get('/api/export/?since=yesterday').status_code, 400)
+
+    def test_cursor_overlaps_records_still_committing(self):
+        session_id = self.post('/api/tutoring/start/', {'user_id': 'cursor-user', 'topic': 'Sets'})['session_id']
+        # Stamped by a request that had not committed when the export began
+        stamped = views.datetime.now().isoformat()
+        response = self.http.get('/api/export/?types=sessions')
+        cursor = response['X-Export-Cursor']
+        b''.join(response.streaming_content)
+        views.tutoring_sessions[session_id]['updated_at'] = stamped
+
+        later = self.http.get(f'/api/export/?types=sessions&since={cursor}')
+        ids = [json.loads(line)['id'] for line in b''.join(later.streaming_content).splitlines()]
+        self.assertIn(session_id, ids)
+
+
+def graded(*outcomes):
+    return [{'question_id': number, 'is_correct': correct} for number, correct in enumerate(outcomes, start=1)]
+
+
+class AnswerStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.store = AnswerStore(capacity=2)
+        self.store.append_exam('u1', 'e1', 'Algebra', graded(True, False), '2026-01-05T10:00:00')
+        self.store.append_exam('u1', 'e2', 'Geometry', graded(True, True, True, False), '2026-01-06T10:00:00')
+        self.store.append_exam('u2', 'e3', 'Algebra', graded(False, False), '2026-01-12T10:00:00')
+
+    def test_group_bys_and_filters(self):
+        topics = {t['topic']: t for t in self.store.topic_summary()}
+        self.assertEqual(topics['Algebra'], {'topic': 'Algebra', 'answers': 4, 'accuracy': 25.0,
+                                             'exams': 2, 'average_score': 25.0})
+        self.assertEqual(topics['Geometry']['average_score'], 75.0)
+        self.assertEqual([t['topic'] for t in self.store.topic_summary(user_ids=['u2'])], ['Algebra'])
+
+        hardest = self.store.hardest_questions(limit=3)
+        self.assertEqual({q['question_key'] for q in hardest}, {'e1:2', 'e3:1', 'e3:2'})
+        self.assertIn({'question_key': 'e1:2', 'exam_id': 'e1', 'question_id': 2,
+                       'attempts': 1, 'accuracy': 0.0}, hardest)
+
+        scores = self.store.score_distribution(topic='Algebra')
+        self.assertEqual((scores['exams'], scores['mean']), (2, 25.0))
+        weekly = self.store.trend('week')
+        self.assertEqual(sum(w['answers'] for w in weekly), 8)
+        self.assertEqual(len(self.store.trend('day', since=views.datetime(2026, 1, 6).timestamp())), 2)
+
+    def test_regrade_replaces_earlier_answers(self):
+        self.store.append_exam('u1', 'e1', 'Algebra', graded(True, True), '2026-01-07T10:00:00')
+        algebra = next(t for t in self.store.topic_summary() if t['topic'] == 'Algebra')
+        self.assertEqual((algebra['answers'], algebra['exams'], algebra['accuracy']), (4, 2, 50.0))
+        accuracy = {q['question_key']: q['accuracy'] for q in self.store.hardest_questions()}
+        self.assertEqual(accuracy['e1:2'], 100.0)
+
+        self.store.append_exam('u1', 'e2', 'Geometry', [], '2026-01-08T10:00:00')
+        self.assertNotIn('Geometry', [t['topic'] for t in self.store.topic_summary()])
+
+
+@override_settings(GEMINI_BACKEND='fake')
+class AnalyticsEndpointTests(SimpleTestCase):
+
+    def test_store_is_built_from_stored_exams(self):
+        reset_client()
+        views.request_counter = 0
+        http = Client()
+        post = lambda path, data: http.post(path, data, content_type='application/json').json()
+        session_id = post('/api/tutoring/start/', {'user_id': 'analytics-user', 'topic': 'Calculus'})['session_id']
+        exam_id = post('/api/exam/generate/', {'session_id': session_id, 'num_questions': 2})['exam_id']
+        post('/api/exam/submit/', {'exam_id': exam_id, 'answers': {'1': 'A', '2': 'B'}})
+
+        # A fresh process has no store yet; the first query builds it
+        views.answer_store = None
+        topics = http.get('/api/analytics/topics/?users=analytics-user').json()['topics']
+        self.assertEqual([(t['topic'], t['answers']) for t in topics], [('Calculus', 2)])
+        questions = http.get('/api/analytics/questions/hardest/?users=analytics-user').json()['questions']
+        stored = views.exam_results[exam_id]['exam_data']['questions']
+        self.assertEqual({q['question'] for q in questions}, {q['question'] for q in stored})
+        self.assertEqual(http.get('/api/analytics/scores/?since=someday').status_code, 400)
+
+    def test_shared_store_refreshes_updated_exams_in_background(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        backend = SQLiteBackend(os.path.join(directory, 'state.sqlite3'))
+        backend.table('sessions')['s1'] = {'user_id': 'u1'}
+
+        def graded(exam_id, day):
+            stamp = f'2026-03-0{day}T09:00:00'
+            return {'exam_data': {'session_id': 's1', 'topic': 'Sets'}, 'score': 50.0,
+                    'graded_at': stamp, 'updated_at': stamp,
+                    'detailed_results': [{'question_id': 1, 'is_correct': True},
+                                         {'question_id': 2, 'is_correct': False}]}
+
+        backend.table('exams')['e1'] = graded('e1', 1)
+        with mock.patch.multiple(views, state=backend, tutoring_sessions=backend.table('sessions'),
+                                 exam_results=backend.table('exams'), answer_store=None,
+                                 answer_store_cursor=None, answer_store_refreshed_at=0.0):
+            with backend.unit_of_work():
+                store = views.get_answer_store()
+                self.assertEqual(backend.current_unit().loaded, {})
+
+            # Another worker grades an exam; the stale store picks it up off the request
+            SQLiteBackend(backend.path).table('exams')['e2'] = graded('e2', 2)
+            views.answer_store_refreshed_at = 0.0
+            with mock.patch.object(backend, 'updated_since', wraps=backend.updated_since) as read:
+                self.assertIs(views.get_answer_store(), store)
+                with views.answer_store_refresh_lock:
+                    pass
+            read.assert_called_once_with('exams', '2026-03-01T08:59:00')
+            self.assertEqual([(t['topic'], t['answers']) for t in store.topic_summary()], [('Sets', 4)])
 
-# Create your tests here.
@@ -0,0 +1,283 @@
+import gzip
+import json
+import os
+import queue
+import statistics
+import threading
+import time
+import zlib
+
+from django.urls import Resolver404, resolve
+
+from .bulk import NDJSON_CONTENT_TYPE
+
+SENSITIVE_KEYS = {'password', 'token', 'api_key', 'apikey', 'authorization', 'secret', 'email'}
+REDACTED = "[redacted]"
+MAX_RECORDED_BODY_BYTES = 256 * 1024  # Larger bodies are logged as a size only
+ID_KEYS = ('session_id', 'exam_id')   # Server-generated IDs remapped during replay
+# Request headers that change what a view does, sent again on replay, and
+# response headers whose recorded values later requests may echo back
+RECORDED_HEADERS = ('If-None-Match', 'Content-Encoding', 'X-Profile')
+RECORDED_RESPONSE_HEADERS = ('ETag',)
+NDJSON_KEY = '_ndjson'  # Bodies of bulk imports are logged as a list of records
+
+def sanitize(value):
+    """Recursively redact sensitive fields from a JSON-like value"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower() in SENSITIVE_KEYS else sanitize(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [sanitize(item) for item in value]
+    return value
+
+def decode_body(raw, encoding=None, content_type=None):
+    """Parse a request/response body for the log, or describe why it wasn't"""
+    if not raw:
+        return None
+    if len(raw) > MAX_RECORDED_BODY_BYTES:
+        return {"_omitted_bytes": len(raw)}
+    if encoding == 'gzip':
+        # Bounded, so a small body can't expand into an unbounded log entry
+        try:
+            inflated = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(raw, MAX_RECORDED_BODY_BYTES + 1)
+        except zlib.error:
+            return {"_omitted_bytes": len(raw)}
+        if len(inflated) > MAX_RECORDED_BODY_BYTES:
+            return {"_omitted_bytes": len(raw)}
+        raw = inflated
+    try:
+        if content_type == NDJSON_CONTENT_TYPE:
+            return {NDJSON_KEY: [sanitize(json.loads(line)) for line in raw.splitlines() if line.strip()]}
+        return sanitize(json.loads(raw))
+    except (ValueError, UnicodeDecodeError):
+        return {"_omitted_bytes": len(raw)}
+
+def recorded_headers(headers, names):
+    """The headers among ``names`` present in a request or response"""
+    return {name: headers[name] for name in names if name in headers}
+
+class TrafficLog:
+    """Append-only JSONL sink written by a background thread.
+
+    Requests only enqueue the entry, so recording adds no file I/O to the
+    request path. The queue is bounded; entries are dropped (and counted)
+    rather than blocking when the disk can't keep up. Each entry is one
+    write() on an O_APPEND descriptor, so lines from several worker
+    processes sharing the file don't interleave.
+    """
+
+    def __init__(self, path, max_pending=10000):
+        self.path = path
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._write_loop, name="traffic-log", daemon=True)
+        self._thread.start()
+
+    def append(self, entry):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5):
+        """Wait until queued entries are on disk"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _write_loop(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        while True:
+            entry = self._queue.get()
+            line = json.dumps(entry, separators=(',', ':'), default=str) + "\n"
+            os.write(fd, line.encode("utf-8"))
+            self._queue.task_done()
+
+def read_log(path):
+    """Yield entries from a traffic log, skipping blank or torn lines"""
+    with open(path, encoding="utf-8") as log:
+        for line in log:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A crash can leave the last line half-written
+
+def endpoint_name(path):
+    """Group requests by URL pattern rather than concrete IDs"""
+    try:
+        return resolve(path).url_name or path
+    except Resolver404:
+        return path
+
+def _remap_path(path, id_map):
+    """A URL path with recorded IDs in its segments replaced"""
+    return "/".join(id_map.get(segment, segment) for segment in path.split("/"))
+
+def _remap(value, id_map):
+    """A request body with recorded IDs in its ID_KEYS fields replaced"""
+    if isinstance(value, dict):
+        return {
+            key: id_map.get(item, item) if key in ID_KEYS and isinstance(item, str)
+            else _remap(item, id_map)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_remap(item, id_map) for item in value]
+    return value
+
+def _replay_headers(headers, etag_map):
+    """Recorded request headers as test client kwargs, with recorded ETags replaced"""
+    extra = {}
+    for name, value in headers.items():
+        if name == 'If-None-Match':
+            value = ", ".join(etag_map.get(tag.strip(), tag.strip()) for tag in value.split(","))
+        extra['HTTP_' + name.upper().replace('-', '_')] = value
+    return extra
+
+def _replay_body(body, encoding):
+    """Re-encode a logged request body as it was sent: JSON or NDJSON, maybe gzipped"""
+    if body is None:
+        return '', 'application/json'
+    if isinstance(body, dict) and NDJSON_KEY in body:
+        data = "".join(json.dumps(record) + "\n" for record in body[NDJSON_KEY])
+        content_type = NDJSON_CONTENT_TYPE
+    else:
+        data = json.dumps(body)
+        content_type = 'application/json'
+    if encoding == 'gzip':
+        return gzip.compress(data.encode()), content_type
+    return data, content_type
+
+def _latency_summary(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 1),
+        "p50_ms": pick(0.5),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99)
+    }
+
+def replay(entries, client, speed=1.0, on_request=None):
+    """Re-drive logged requests through a Django test client.
+
+    ``speed`` scales the original inter-arrival gaps (2.0 replays twice as
+    fast, 0 sends back to back). Session and exam IDs created during the
+    replay are substituted for the recorded ones in later requests.
+    ``on_request`` is called with each entry before it is sent, which is
+    how a recorded LLM backend is primed. Recorded headers (conditional
+    GETs, gzip-encoded bodies, forced profiling) are sent again, with ETags
+    the recording saw replaced by the ones this replay was given.
+
+    Returns per-endpoint latency and error comparisons between the
+    recording and the replay.
+    """
+    id_map = {}
+    etag_map = {}
+    results = {}
+    started = time.monotonic()
+    first_ts = None
+
+    for entry in entries:
+        if first_ts is None:
+            first_ts = entry['ts']
+        if speed:
+            due = (entry['ts'] - first_ts) / speed
+            delay = due - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+        if on_request:
+            on_request(entry)
+
+        path = _remap_path(entry['path'], id_map)
+        body = _remap(entry.get('request'), id_map)
+        query = entry.get('query') or ''
+        url = f"{path}?{query}" if query else path
+        headers = entry.get('headers') or {}
+        extra = _replay_headers(headers, etag_map)
+
+        begin = time.perf_counter()
+        if entry['method'] == 'GET':
+            response = client.get(url, **extra)
+        else:
+            data, content_type = _replay_body(body, headers.get('Content-Encoding'))
+            response = client.generic(entry['method'], url, data, content_type=content_type, **extra)
+        elapsed = (time.perf_counter() - begin) * 1000
+
+        recorded_etag = (entry.get('response_headers') or {}).get('ETag')
+        if recorded_etag and response.get('ETag'):
+            etag_map[recorded_etag] = response['ETag']
+
+        try:
+            replayed_body = json.loads(response.content) if response.content else None
+        except (ValueError, AttributeError):
+            replayed_body = None
+        recorded_body = entry.get('response')
+        if isinstance(recorded_body, dict) and isinstance(replayed_body, dict):
+            for key in ID_KEYS:
+                old, new = recorded_body.get(key), replayed_body.get(key)
+                if isinstance(old, str) and isinstance(new, str) and old != new:
+                    id_map[old] = new
+
+        name = f"{entry['method']} {endpoint_name(path)}"
+        stats = results.setdefault(name, {
+            "recorded_ms": [], "replayed_ms": [], "recorded_errors": 0, "replayed_errors": 0,
+            "status_mismatches": 0
+        })
+        stats["recorded_ms"].append(entry['duration_ms'])
+        stats["replayed_ms"].append(elapsed)
+        stats["recorded_errors"] += entry['status'] >= 500
+        stats["replayed_errors"] += response.status_code >= 500
+        stats["status_mismatches"] += response.status_code != entry['status']
+
+    return build_report(results)
+
+def build_report(results):
+    report = {"endpoints": {}, "total": {}}
+    all_recorded, all_replayed = [], []
+    totals = {"requests": 0, "recorded_errors": 0, "replayed_errors": 0, "status_mismatches": 0}
+    for name, stats in sorted(results.items()):
+        count = len(stats["replayed_ms"])
+        recorded = _latency_summary(stats["recorded_ms"])
+        replayed = _latency_summary(stats["replayed_ms"])
+        report["endpoints"][name] = {
+            "requests": count,
+            "recorded": recorded,
+            "replayed": replayed,
+            "p95_delta_ms": round(replayed["p95_ms"] - recorded["p95_ms"], 1),
+            "recorded_error_rate": round(stats["recorded_errors"] / count, 4),
+            "replayed_error_rate": round(stats["replayed_errors"] / count, 4),
+            "status_mismatches": stats["status_mismatches"]
+        }
+        all_recorded += stats["recorded_ms"]
+        all_replayed += stats["replayed_ms"]
+        totals["requests"] += count
+        for key in ("recorded_errors", "replayed_errors", "status_mismatches"):
+            totals[key] += stats[key]
+
+    report["total"] = dict(totals, recorded=_latency_summary(all_recorded),
+                           replayed=_latency_summary(all_replayed))
+    return report
+
+def compare_reports(baseline, current):
+    """p95 latency and error-rate deltas per endpoint between two replay reports"""
+    deltas = {}
+    for name, now in current["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            continue
+        deltas[name] = {
+            "p95_ms": (before["replayed"]["p95_ms"], now["replayed"]["p95_ms"]),
+            "p95_delta_ms": round(now["replayed"]["p95_ms"] - before["replayed"]["p95_ms"], 1),
+            "error_rate_delta": round(now["replayed_error_rate"] - before["replayed_error_rate"], 4)
+        }
+    return deltas
@@ -8,8 +8,17 @@ from .views import (
     get_learning_path,
     get_session_progress,
     get_user_profile,
+    list_user_sessions,
+    list_user_exams,
     explain_concept,
-    get_exam_results
+    get_exam_results,
+    export_data,
+    import_data,
+    analytics_topics,
+    analytics_hardest_questions,
+    analytics_scores,
+    analytics_trend,
+    routing_stats
 )
 
 urlpatterns = [
@@ -30,6 +39,21 @@ urlpatterns = [
     path('learning/path/', get_learning_path, name='learning_path'),
     path('learning/explain/', explain_concept, name='explain_concept'),
     
-    # User profile endpoint
+    # User profile endpoints
     path('user/<str:user_id>/profile/', get_user_profile, name='user_profile'),
+    path('user/<str:user_id>/sessions/', list_user_sessions, name='user_sessions'),
+    path('user/<str:user_id>/exams/', list_user_exams, name='user_exams'),
+    
+    # Bulk data endpoints
+    path('export/', export_data, name='export_data'),
+    path('import/', import_data, name='import_data'),
+    
+    # Cohort analytics endpoints
+    path('analytics/topics/', analytics_topics, name='analytics_topics'),
+    path('analytics/questions/hardest/', analytics_hardest_questions, name='analytics_hardest_questions'),
+    path('analytics/scores/', analytics_scores, name='analytics_scores'),
+    path('analytics/trend/', analytics_trend, name='analytics_trend'),
+    
+    # Model routing diagnostics
+    path('routing/stats/', routing_stats, name='routing_stats'),
 ]
\ No newline at end of file
@@ -1,37 +1,87 @@
-from rest_framework.decorators import api_view
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import api_view, parser_classes
 from rest_framework.response import Response
 from rest_framework import status
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
-import os
+import gzip
+import heapq
 import json
+import threading
+import time
 import uuid
-from datetime import datetime
+from bisect import insort
+from datetime import datetime, timedelta
+from functools import partial
+from .bulk import (
+    EXPORT_TYPES,
+    IMPORT_BATCH_SIZE,
+    NDJSON_CONTENT_TYPE,
+    batched,
+    export_cursor,
+    iter_ndjson,
+    read_ndjson,
+    validate_record,
+)
+from .dedup import QuestionIndex, minhash_signature
+from .events import session_events
+from .pagination import PaginationError, paginate_by_time, parse_page_size, parse_time_bound
+from .prefetch import (
+    PREFETCH_ROUTE,
+    explanation_cache,
+    explanation_key,
+    extract_next_concepts,
+    prefetcher,
+)
+from .profiling import span
+from .prompts import (
+    bounded_text,
+    feedback_results_text,
+    prompt_metrics,
+    recent_conversation,
+    session_summary_text,
+)
+from .routing import generate, router
+from .state import get_backend
 
-load_dotenv()
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
-# In-memory storage (in production, use a proper database)
-tutoring_sessions = {}  # session_id: session_data
-user_profiles = {}      # user_id: profile_data
-exam_results = {}       # exam_id: result_data
+# Records live in the backend chosen by STATE_BACKEND: in-process dicts by
+# default, or a SQLite file shared by all workers on the host
+state = get_backend()
+tutoring_sessions = state.table('sessions')  # session_id: session_data
+user_profiles = state.table('profiles')      # user_id: profile_data
+exam_results = state.table('exams')          # exam_id: result_data
+question_index = QuestionIndex()  # Near-duplicate lookup over stored exam questions
+answer_store = None               # Columnar copy of graded answers, see get_answer_store()
+answer_store_pending = None       # Answers graded while the store is first built
+answer_store_cursor = None        # Newest exam updated_at the store has read
+answer_store_refreshed_at = 0.0
+answer_store_lock = threading.Lock()          # Publishing the store; held briefly by grading
+answer_store_refresh_lock = threading.Lock()  # One build or refresh at a time
 
 # Global counters
 request_counter = 0
 MAX_REQUESTS = 100
 
-def get_or_create_session(user_id, topic=None):
-    """Get existing session or create new one"""
-    session_id = str(uuid.uuid4())
-    
+def get_or_create_profile(user_id):
+    """Get a user's profile, creating an empty one on first use"""
     if user_id not in user_profiles:
         user_profiles[user_id] = {
             'sessions': [],
             'learning_progress': {},
             'strengths': [],
-            'weaknesses': []
+            'weaknesses': [],
+            'graded_exams': [],        # exam_ids in graded_at order
+            'sessions_by_topic': {},   # topic: session_ids in created_at order
+            'exams_by_topic': {},      # topic: exam_ids in graded_at order
+            'stats': new_history_stats(),
+            'updated_at': datetime.now().isoformat(),
+            'version': 1
         }
+    return user_profiles[user_id]
+
+def get_or_create_session(user_id, topic=None):
+    """Get existing session or create new one"""
+    session_id = str(uuid.uuid4())
+    now = datetime.now().isoformat()
     
     session_data = {
         'session_id': session_id,
@@ -41,15 +91,249 @@ def get_or_create_session(user_id, topic=None):
         'learning_objectives': [],
         'concepts_covered': [],
         'difficulty_level': 'beginner',
-        'created_at': datetime.now().isoformat(),
-        'status': 'active'
+        'created_at': now,
+        'updated_at': now,
+        'status': 'active',
+        'version': 1  # Bumped on every mutation, used for ETags
     }
     
     tutoring_sessions[session_id] = session_data
-    user_profiles[user_id]['sessions'].append(session_id)
+    attach_session(get_or_create_profile(user_id), session_data)
     
     return session_data
 
+def session_created_at(session_id):
+    """Sort key for session history lists"""
+    return tutoring_sessions[session_id]['created_at']
+
+def exam_graded_at(exam_id):
+    """Sort key for graded exam history lists"""
+    return exam_results[exam_id]['graded_at']
+
+def restore_history_order(profile):
+    """Re-sort a profile's history lists after concurrent changes were merged.
+
+    The merge appends each side's additions without knowing their times,
+    and cursor pagination relies on the lists being in time order.
+    """
+    def created_at(session_id):
+        session = tutoring_sessions.get(session_id)
+        return session['created_at'] if session else ''
+    
+    def graded_at(exam_id):
+        exam_result = exam_results.get(exam_id)
+        return (exam_result['graded_at'] or '') if exam_result else ''
+    
+    for ids in (profile['sessions'], *profile['sessions_by_topic'].values()):
+        ids.sort(key=created_at)
+    for ids in (profile['graded_exams'], *profile['exams_by_topic'].values()):
+        ids.sort(key=graded_at)
+
+state.merge_hooks['profiles'] = restore_history_order
+
+def attach_session(profile, session):
+    """Add a stored session to its owner's history lists and aggregates"""
+    session_id = session['session_id']
+    # New sessions land at the end, so insort is an append in the common case
+    insort(profile['sessions'], session_id, key=session_created_at)
+    insort(profile['sessions_by_topic'].setdefault(session['topic'], []),
+           session_id, key=session_created_at)
+    record_session_stats(profile['stats'], session['topic'])
+    bump_version(profile)
+
+def new_history_stats():
+    """Empty aggregate counters for a user's history"""
+    return {'session_count': 0, 'exam_count': 0, 'score_total': 0.0, 'topics': {}}
+
+def topic_stats(stats, topic):
+    """Get the per-topic counters, creating them on first use"""
+    return stats['topics'].setdefault(topic, {'sessions': 0, 'exams': 0, 'score_total': 0.0})
+
+def record_session_stats(stats, topic):
+    """Count a new session in the user's aggregates"""
+    stats['session_count'] += 1
+    topic_stats(stats, topic)['sessions'] += 1
+
+def record_exam_stats(profile, exam_id, topic, score, previous_score=None):
+    """Add a graded exam to the user's history lists and aggregates"""
+    stats = profile['stats']
+    per_topic = topic_stats(stats, topic)
+    by_topic = profile['exams_by_topic'].setdefault(topic, [])
+    
+    if previous_score is None:
+        stats['exam_count'] += 1
+        per_topic['exams'] += 1
+    else:
+        # Regraded: undo the old score and move the exam to the end of the history
+        stats['score_total'] -= previous_score
+        per_topic['score_total'] -= previous_score
+        profile['graded_exams'].remove(exam_id)
+        by_topic.remove(exam_id)
+    
+    stats['score_total'] += score
+    per_topic['score_total'] += score
+    insort(profile['graded_exams'], exam_id, key=exam_graded_at)
+    insort(by_topic, exam_id, key=exam_graded_at)
+
+def summarize_history_stats(stats):
+    """Turn aggregate counters into counts and averages for responses"""
+    def average(total, count):
+        return round(total / count, 2) if count else None
+    
+    return {
+        "session_count": stats['session_count'],
+        "exam_count": stats['exam_count'],
+        "average_score": average(stats['score_total'], stats['exam_count']),
+        "topics": {
+            topic: {
+                "session_count": counts['sessions'],
+                "exam_count": counts['exams'],
+                "average_score": average(counts['score_total'], counts['exams'])
+            }
+            for topic, counts in stats['topics'].items()
+        }
+    }
+
+def session_summary(session_id):
+    """Short listing entry for a tutoring session"""
+    session = tutoring_sessions[session_id]
+    return {
+        "session_id": session_id,
+        "topic": session['topic'],
+        "status": session['status'],
+        "created_at": session['created_at'],
+        "concepts_count": len(session['concepts_covered'])
+    }
+
+def exam_summary(exam_id):
+    """Short listing entry for a graded exam"""
+    exam_result = exam_results[exam_id]
+    return {
+        "exam_id": exam_id,
+        "topic": exam_result['exam_data']['topic'],
+        "score": exam_result['score'],
+        "graded_at": exam_result['graded_at']
+    }
+
+def bump_version(record):
+    """Mark a session, profile or exam result as changed"""
+    record['version'] = record.get('version', 0) + 1
+    record['updated_at'] = datetime.now().isoformat()
+
+def make_etag(kind, key, record):
+    """Build a weak ETag from a record's version counter and last change time"""
+    # Versions restart at 1 when a record is recreated (e.g. after a restart
+    # with the dict backend), so the timestamp keeps old tags from matching
+    changed = "".join(ch for ch in record.get('updated_at', '') if ch.isdigit())
+    return f'W/"{kind}-{key}-{record.get("version", 0)}-{changed}"'
+
+def not_modified(request, etag):
+    """Return a 304 response if the client already holds this version"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    client_etags = [tag.strip() for tag in if_none_match.split(',')]
+    if etag in client_etags or '*' in client_etags:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        return response
+    return None
+
+def extract_json_text(text):
+    """Strip markdown code fences around a JSON response"""
+    if "```json" in text:
+        start = text.find("```json") + 7
+        end = text.rfind("```")
+        text = text[start:end].strip()
+    elif "```" in text:
+        start = text.find("```") + 3
+        end = text.rfind("```")
+        text = text[start:end].strip()
+    return text
+
+def request_replacement_questions(session, difficulty, count, dropped_questions):
+    """Ask for fresh questions to replace dropped near-duplicates"""
+    avoid = "\n".join(f"- {q['question']}" for q in dropped_questions)
+    replacement_prompt = f"""Create {count} new multiple choice questions about {session['topic']} at {difficulty} difficulty level.
+    
+    The questions must be clearly different from these existing ones:
+    {avoid}
+    
+    Return ONLY a valid JSON object in this exact format:
+    {{
+        "questions": [
+            {{
+                "question_id": 1,
+                "question": "Question text here?",
+                "options": ["A) Option 1", "B) Option 2", "C) Option 3", "D) Option 4"],
+                "correct_answer": "A",
+                "explanation": "Why this answer is correct"
+            }}
+        ]
+    }}
+    """
+    
+    response = generate(
+        "exam_generate",
+        replacement_prompt,
+        "You are an expert exam creator. Return only valid JSON.",
+        difficulty=difficulty
+    )
+    
+    return json.loads(extract_json_text(response.text.strip())).get('questions', [])
+
+def add_message(session, role, content):
+    """Append a turn to the session transcript"""
+    session['conversation_history'].append({
+        "role": role, 
+        "content": content,
+        "timestamp": datetime.now().isoformat()
+    })
+    bump_version(session)
+
+def build_tutoring_prompt(session):
+    """Build the system instruction and recent conversation for a tutoring turn"""
+    # Last 10 messages, trimmed to the tutoring prompt budget
+    with span("prompt_build"):
+        conversation_context = recent_conversation(session['conversation_history'])
+        # Both lists grow without limit, so they get budgets too
+        objectives = bounded_text('session_objectives', ', '.join(session['learning_objectives']))
+        concepts = bounded_text('session_concepts', ', '.join(session['concepts_covered']), keep='end')
+    
+    system_instruction = f"""You are tutoring {session['topic']} at {session['difficulty_level']} level.
+    Learning objectives: {objectives}
+    Concepts already covered: {concepts}
+    
+    Guidelines:
+    - Provide clear, step-by-step explanations
+    - Use examples and analogies appropriate for the difficulty level
+    - Ask follow-up questions to check understanding
+    - Adapt your teaching style based on student responses
+    - Identify and note new concepts being taught
+    - Be encouraging and patient
+    - If student seems confused, simplify and try different approaches
+    - If student is ready, suggest moving to more advanced topics
+    - When you suggest what to study next, end with a line "Next concepts: <concept>, <concept>"
+    """
+    
+    return system_instruction, conversation_context
+
+def prefetch_explanations(session, concepts):
+    """Speculatively generate explanations for the concepts a reply suggests next"""
+    if not getattr(settings, 'PREFETCH_ENABLED', False):
+        return
+    
+    context = session_context(session)
+    difficulty = session['difficulty_level']
+    jobs = []
+    for concept in concepts:
+        prompt = build_explanation_prompt(concept, context, difficulty, DEFAULT_EXPLANATION_TYPE)
+        produce = partial(generate, PREFETCH_ROUTE, prompt, EXPLANATION_INSTRUCTION, difficulty=difficulty)
+        jobs.append((
+            explanation_key(concept, difficulty, DEFAULT_EXPLANATION_TYPE, context),
+            lambda produce=produce: produce().text.strip()
+        ))
+    # Also cancels speculation for concepts this reply no longer suggests
+    prefetcher.schedule(session['session_id'], jobs)
+
 @api_view(['POST'])
 def start_tutoring_session(request):
     """Start a new personalized tutoring session"""
@@ -73,11 +357,12 @@ def start_tutoring_session(request):
     session = get_or_create_session(user_id, topic)
     session['learning_objectives'] = learning_goals
     session['difficulty_level'] = difficulty_level
+    bump_version(session)
     
     # Generate personalized introduction
     system_instruction = f"""You are an expert tutor specializing in {topic}. 
     Your student wants to learn about {topic} at a {difficulty_level} level.
-    Learning goals: {', '.join(learning_goals) if learning_goals else 'General understanding'}
+    Learning goals: {bounded_text('tutoring_start', ', '.join(learning_goals)) if learning_goals else 'General understanding'}
     
     Start by:
     1. Greeting the student warmly
@@ -88,13 +373,10 @@ def start_tutoring_session(request):
     Be encouraging, adaptive, and interactive."""
     
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                temperature=0.7
-            ),
-            contents=f"Start a tutoring session for {topic}"
+        response = generate(
+            "tutoring_start",
+            f"Start a tutoring session for {topic}",
+            system_instruction
         )
         
         intro_message = response.text.strip()
@@ -103,6 +385,7 @@ def start_tutoring_session(request):
             "content": intro_message,
             "timestamp": datetime.now().isoformat()
         })
+        bump_version(session)
         
         return Response({
             "session_id": session['session_id'],
@@ -139,58 +422,20 @@ def tutoring_chat(request):
                        status=status.HTTP_400_BAD_REQUEST)
     
     session = tutoring_sessions[session_id]
-    session['conversation_history'].append({
-        "role": "user", 
-        "content": user_message,
-        "timestamp": datetime.now().isoformat()
-    })
-    
-    # Build context for AI
-    conversation_context = ""
-    for msg in session['conversation_history'][-10:]:  # Last 10 messages
-        role = msg["role"].capitalize()
-        conversation_context += f"{role}: {msg['content']}\n"
-    
-    system_instruction = f"""You are tutoring {session['topic']} at {session['difficulty_level']} level.
-    Learning objectives: {', '.join(session['learning_objectives'])}
-    Concepts already covered: {', '.join(session['concepts_covered'])}
-    
-    Guidelines:
-    - Provide clear, step-by-step explanations
-    - Use examples and analogies appropriate for the difficulty level
-    - Ask follow-up questions to check understanding
-    - Adapt your teaching style based on student responses
-    - Identify and note new concepts being taught
-    - Be encouraging and patient
-    - If student seems confused, simplify and try different approaches
-    - If student is ready, suggest moving to more advanced topics
-    """
+    add_message(session, "user", user_message)
+    system_instruction, conversation_context = build_tutoring_prompt(session)
     
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                temperature=0.7
-            ),
-            contents=conversation_context
-        )
+        response = generate("tutoring_chat", conversation_context, system_instruction)
         
-        assistant_message = response.text.strip()
-        session['conversation_history'].append({
-            "role": "assistant", 
-            "content": assistant_message,
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # Simple concept extraction (in production, use more sophisticated NLP)
-        if "concept:" in assistant_message.lower():
-            # Extract concepts mentioned in the response
-            pass  # Implement concept extraction logic
+        assistant_message, next_concepts = extract_next_concepts(response.text.strip())
+        add_message(session, "assistant", assistant_message)
+        prefetch_explanations(session, next_concepts)
         
         return Response({
             "session_id": session_id,
             "reply": assistant_message,
+            "next_concepts": next_concepts,
             "concepts_covered": session['concepts_covered']
         })
         
@@ -219,18 +464,19 @@ def generate_exam(request):
     
     session = tutoring_sessions[session_id]
     
-    # Analyze conversation to extract key concepts
-    conversation_summary = ""
-    for msg in session['conversation_history']:
-        if msg['role'] == 'assistant':
-            conversation_summary += msg['content'] + "\n"
+    # Summarize what was taught, within the exam prompt budget
+    with span("prompt_build"):
+        conversation_summary = session_summary_text(session['conversation_history'])
     
     exam_prompt = f"""Based on the tutoring session about {session['topic']}, create {num_questions} multiple choice questions at {difficulty} difficulty level.
 
     Topic: {session['topic']}
-    Concepts covered: {', '.join(session['concepts_covered']) if session['concepts_covered'] else 'Extract from conversation'}
+    Concepts covered: {bounded_text('session_concepts', ', '.join(session['concepts_covered']), keep='end') if session['concepts_covered'] else 'Extract from conversation'}
     Difficulty level: {session['difficulty_level']}
     
+    What was taught in the session:
+    {conversation_summary if conversation_summary else 'No explanations yet'}
+    
     Return ONLY a valid JSON object in this exact format:
     {{
         "exam_id": "unique_id",
@@ -251,28 +497,38 @@ def generate_exam(request):
     """
     
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            config=types.GenerateContentConfig(
-                system_instruction="You are an expert exam creator. Return only valid JSON.",
-                temperature=0.3
-            ),
-            contents=exam_prompt
+        response = generate(
+            "exam_generate",
+            exam_prompt,
+            "You are an expert exam creator. Return only valid JSON.",
+            difficulty=difficulty
         )
         
-        exam_json_text = response.text.strip()
+        with span("parse"):
+            exam_json_text = extract_json_text(response.text.strip())
+            exam_data = json.loads(exam_json_text)
         
-        # Clean up response to extract JSON
-        if "```json" in exam_json_text:
-            start = exam_json_text.find("```json") + 7
-            end = exam_json_text.rfind("```")
-            exam_json_text = exam_json_text[start:end].strip()
-        elif "```" in exam_json_text:
-            start = exam_json_text.find("```") + 3
-            end = exam_json_text.rfind("```")
-            exam_json_text = exam_json_text[start:end].strip()
+        # Drop near-duplicates within the exam and against the user's past exams
+        user_id = session['user_id']
+        with span("dedup"):
+            unique, duplicates = question_index.filter_new_questions(user_id, exam_data['questions'])
+        if duplicates:
+            try:
+                replacements = request_replacement_questions(
+                    session, difficulty, len(duplicates), duplicates)
+                unique, _ = question_index.filter_new_questions(
+                    user_id, replacements[:len(duplicates)], accepted=unique)
+            except Exception:
+                pass  # Serve the exam without replacements
+        if not unique:
+            # Everything repeats earlier exams; a repeated exam beats an empty one,
+            # but still drop repeats within this exam
+            unique, _ = QuestionIndex().filter_new_questions(user_id, exam_data['questions'])
+        
+        exam_data['questions'] = [q for q, _ in unique]
+        for number, question in enumerate(exam_data['questions'], start=1):
+            question['question_id'] = number
         
-        exam_data = json.loads(exam_json_text)
         exam_id = str(uuid.uuid4())
         exam_data['exam_id'] = exam_id
         exam_data['session_id'] = session_id
@@ -283,9 +539,14 @@ def generate_exam(request):
             'exam_data': exam_data,
             'submitted_answers': None,
             'score': None,
-            'graded_at': None
+            'graded_at': None,
+            'updated_at': exam_data['created_at'],
+            'version': 1
         }
         
+        for question, signature in unique:
+            question_index.insert(user_id, f"{exam_id}:{question['question_id']}", signature)
+        
         # Remove correct answers from response to student
         student_exam = {
             "exam_id": exam_id,
@@ -301,6 +562,8 @@ def generate_exam(request):
                 "options": q['options']
             })
         
+        session_events.publish(session_id, {"type": "exam_ready", "exam": student_exam})
+        
         return Response(student_exam)
         
     except json.JSONDecodeError:
@@ -334,29 +597,31 @@ def submit_exam(request):
     
     exam_result = exam_results[exam_id]
     exam_data = exam_result['exam_data']
+    previous_score = exam_result['score']
     
     # Grade the exam
     correct_count = 0
     total_questions = len(exam_data['questions'])
     detailed_results = []
     
-    for question in exam_data['questions']:
-        q_id = question['question_id']
-        correct_answer = question['correct_answer']
-        submitted_answer = submitted_answers.get(str(q_id), "")
-        is_correct = submitted_answer == correct_answer
-        
-        if is_correct:
-            correct_count += 1
-        
-        detailed_results.append({
-            "question_id": q_id,
-            "question": question['question'],
-            "submitted_answer": submitted_answer,
-            "correct_answer": correct_answer,
-            "is_correct": is_correct,
-            "explanation": question['explanation']
-        })
+    with span("grade"):
+        for question in exam_data['questions']:
+            q_id = question['question_id']
+            correct_answer = question['correct_answer']
+            submitted_answer = submitted_answers.get(str(q_id), "")
+            is_correct = submitted_answer == correct_answer
+            
+            if is_correct:
+                correct_count += 1
+            
+            detailed_results.append({
+                "question_id": q_id,
+                "question": question['question'],
+                "submitted_answer": submitted_answer,
+                "correct_answer": correct_answer,
+                "is_correct": is_correct,
+                "explanation": question['explanation']
+            })
     
     score_percentage = (correct_count / total_questions) * 100
     
@@ -369,15 +634,27 @@ def submit_exam(request):
         'detailed_results': detailed_results,
         'graded_at': datetime.now().isoformat()
     })
+    bump_version(exam_result)
+    
+    # The owner's profile lists graded exams, so it changes too
+    exam_session = tutoring_sessions.get(exam_data.get('session_id'))
+    if exam_session and exam_session['user_id'] in user_profiles:
+        owner_profile = user_profiles[exam_session['user_id']]
+        record_exam_stats(owner_profile, exam_id, exam_data['topic'],
+                          score_percentage, previous_score)
+        bump_version(owner_profile)
+        record_graded_answers(exam_session['user_id'], exam_id, exam_result)
     
     # Generate personalized feedback
+    with span("prompt_build"):
+        wrong_answers = feedback_results_text(detailed_results)
     feedback_prompt = f"""Based on this exam performance, provide constructive feedback:
     
     Topic: {exam_data['topic']}
     Score: {score_percentage:.1f}% ({correct_count}/{total_questions})
     
-    Questions and performance:
-    {json.dumps(detailed_results, indent=2)}
+    Questions answered incorrectly ({total_questions - correct_count} of {total_questions}):
+    {wrong_answers}
     
     Provide:
     1. Overall performance assessment
@@ -390,16 +667,14 @@ def submit_exam(request):
     """
     
     try:
-        feedback_response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            config=types.GenerateContentConfig(
-                system_instruction="You are an encouraging tutor providing personalized feedback.",
-                temperature=0.6
-            ),
-            contents=feedback_prompt
+        feedback_response = generate(
+            "exam_feedback",
+            feedback_prompt,
+            "You are an encouraging tutor providing personalized feedback."
         )
         
         feedback = feedback_response.text.strip()
+        publish_feedback_ready(exam_data, exam_id, score_percentage, feedback)
         
         return Response({
             "exam_id": exam_id,
@@ -413,6 +688,8 @@ def submit_exam(request):
         })
         
     except Exception as e:
+        publish_feedback_ready(exam_data, exam_id, score_percentage,
+                               "Exam graded successfully, but feedback generation failed.")
         return Response({
             "exam_id": exam_id,
             "score": score_percentage,
@@ -424,6 +701,16 @@ def submit_exam(request):
             "error": str(e)
         })
 
+def publish_feedback_ready(exam_data, exam_id, score_percentage, feedback):
+    """Notify live connections on the exam's session that grading finished"""
+    session_events.publish(exam_data.get('session_id'), {
+        "type": "feedback_ready",
+        "exam_id": exam_id,
+        "score": score_percentage,
+        "grade": get_letter_grade(score_percentage),
+        "feedback": feedback
+    })
+
 @api_view(['POST'])
 def get_learning_path(request):
     """Get personalized learning path recommendation"""
@@ -448,15 +735,16 @@ def get_learning_path(request):
     user_profile = user_profiles.get(user_id, {})
     past_sessions = []
     
-    for session_id in user_profile.get('sessions', []):
-        if session_id in tutoring_sessions:
-            past_sessions.append(tutoring_sessions[session_id])
+    with span("profile_scan"):
+        for session_id in user_profile.get('sessions', []):
+            if session_id in tutoring_sessions:
+                past_sessions.append(tutoring_sessions[session_id])
     
     learning_path_prompt = f"""Create a personalized learning path for:
     
     Subject: {subject}
     Current Level: {current_level}
-    Goals: {', '.join(goals) if goals else 'General mastery'}
+    Goals: {bounded_text('learning_path', ', '.join(goals)) if goals else 'General mastery'}
     Past Performance: {len(past_sessions)} previous sessions
     
     Return a JSON object with this structure:
@@ -476,24 +764,22 @@ def get_learning_path(request):
     """
     
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            config=types.GenerateContentConfig(
-                system_instruction="You are an educational planning expert. Return only valid JSON.",
-                temperature=0.4
-            ),
-            contents=learning_path_prompt
+        response = generate(
+            "learning_path",
+            learning_path_prompt,
+            "You are an educational planning expert. Return only valid JSON."
         )
         
         path_text = response.text.strip()
         
-        # Clean up JSON response
-        if "```json" in path_text:
-            start = path_text.find("```json") + 7
-            end = path_text.rfind("```")
-            path_text = path_text[start:end].strip()
-        
-        learning_path = json.loads(path_text)
+        with span("parse"):
+            # Clean up JSON response
+            if "```json" in path_text:
+                start = path_text.find("```json") + 7
+                end = path_text.rfind("```")
+                path_text = path_text[start:end].strip()
+            
+            learning_path = json.loads(path_text)
         
         return Response(learning_path)
         
@@ -510,6 +796,11 @@ def get_session_progress(request, session_id):
     
     session = tutoring_sessions[session_id]
     
+    etag = make_etag('session', session_id, session)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
     # Calculate progress metrics
     total_messages = len(session['conversation_history'])
     concepts_learned = len(session['concepts_covered'])
@@ -526,7 +817,9 @@ def get_session_progress(request, session_id):
         "learning_objectives": session['learning_objectives']
     }
     
-    return Response(progress_data)
+    response = Response(progress_data)
+    response['ETag'] = etag
+    return response
 
 @api_view(['GET'])
 def get_user_profile(request, user_id):
@@ -536,33 +829,34 @@ def get_user_profile(request, user_id):
                        status=status.HTTP_404_NOT_FOUND)
     
     profile = user_profiles[user_id]
+    summary_only = request.query_params.get("summary", "").lower() in ("1", "true", "yes")
+    
+    etag = make_etag('profile-summary' if summary_only else 'profile', user_id, profile)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    if summary_only:
+        # Aggregates are maintained incrementally, so this stays O(topics)
+        response = Response({
+            "user_id": user_id,
+            "summary": summarize_history_stats(profile['stats']),
+            "learning_progress": profile['learning_progress'],
+            "strengths": profile['strengths'],
+            "weaknesses": profile['weaknesses']
+        })
+        response['ETag'] = etag
+        return response
     
-    # Get session summaries
-    session_summaries = []
-    for session_id in profile['sessions']:
-        if session_id in tutoring_sessions:
-            session = tutoring_sessions[session_id]
-            session_summaries.append({
-                "session_id": session_id,
-                "topic": session['topic'],
-                "status": session['status'],
-                "created_at": session['created_at'],
-                "concepts_count": len(session['concepts_covered'])
-            })
-    
-    # Get exam history
-    user_exams = []
-    for exam_id, exam_result in exam_results.items():
-        if exam_result['exam_data'].get('session_id') in profile['sessions']:
-            if exam_result['score'] is not None:
-                user_exams.append({
-                    "exam_id": exam_id,
-                    "topic": exam_result['exam_data']['topic'],
-                    "score": exam_result['score'],
-                    "graded_at": exam_result['graded_at']
-                })
+    with span("profile_scan"):
+        # Get session summaries
+        session_summaries = [session_summary(session_id) for session_id in profile['sessions']
+                             if session_id in tutoring_sessions]
+        
+        # Get exam history
+        user_exams = [exam_summary(exam_id) for exam_id in profile['graded_exams']]
     
-    return Response({
+    response = Response({
         "user_id": user_id,
         "sessions": session_summaries,
         "exam_history": user_exams,
@@ -570,30 +864,391 @@ def get_user_profile(request, user_id):
         "strengths": profile['strengths'],
         "weaknesses": profile['weaknesses']
     })
+    response['ETag'] = etag
+    return response
+
+def iter_export_records(since=None, types=EXPORT_TYPES):
+    """Yield sessions (with transcripts) and graded exams changed since a timestamp.
+
+    Only a snapshot of the keys is taken up front; records are read and
+    yielded one at a time so memory stays flat however much is stored.
+    Sessions come first so importers can attach exams to their owners.
+    """
+    if 'sessions' in types:
+        for session_id in tuple(tutoring_sessions):
+            session = tutoring_sessions.get(session_id)
+            if session is None or (since and session['updated_at'] < since):
+                continue
+            yield {"type": "session", "id": session_id, "data": session}
+    
+    if 'exams' in types:
+        for exam_id in tuple(exam_results):
+            exam_result = exam_results.get(exam_id)
+            if exam_result is None or exam_result['score'] is None:
+                continue
+            if since and exam_result['updated_at'] < since:
+                continue
+            yield {"type": "exam", "id": exam_id, "data": exam_result}
+
+def import_records(records, batch_size=IMPORT_BATCH_SIZE):
+    """Store exported records in batches, rebuilding profile history and aggregates.
+
+    Returns the number of sessions and exams imported.
+    """
+    counts = {"sessions": 0, "exams": 0}
+    newest = []  # Heap of the newest graded exams: (graded_at, exam_id, user_id)
+    with state.unit_of_work():
+        for batch in batched(records, batch_size):
+            import_batch(batch, counts, newest)
+            # One write per batch on shared backends
+            state.checkpoint()
+        index_imported_questions(newest)
+    return counts
+
+def index_imported_questions(newest):
+    """Add the questions of the newest imported exams to the dedup index.
+
+    The index only keeps each user's newest questions (and a bounded
+    total), so signing every imported question would mostly be thrown
+    away; only what the index would keep is signed, oldest first.
+    """
+    budget = question_index.max_items
+    per_user = {}
+    selected = []
+    for graded_at, exam_id, user_id in sorted(newest, reverse=True):
+        questions = exam_results[exam_id]['exam_data']['questions']
+        used = per_user.get(user_id, 0)
+        if not budget:
+            break
+        if used + len(questions) > question_index.max_per_scope:
+            continue
+        per_user[user_id] = used + len(questions)
+        budget = max(budget - len(questions), 0)
+        selected.append((user_id, exam_id, questions))
+    
+    for user_id, exam_id, questions in reversed(selected):
+        for question in questions:
+            question_index.insert(user_id, f"{exam_id}:{question['question_id']}",
+                                  minhash_signature(question))
+
+def import_batch(batch, counts, newest):
+    """Store one batch of exported records.
+
+    The whole batch is validated before anything is stored. Records are
+    attached to their owner's profile unless it already lists them, so
+    re-importing a file after a failed import repairs what it left.
+    """
+    for record in batch:
+        validate_record(record)
+    sessions = {r['id']: r['data'] for r in batch if r['type'] == 'session'}
+    exams = {r['id']: r['data'] for r in batch if r['type'] == 'exam'}
+    previous_scores = {eid: exam_results[eid]['score'] if eid in exam_results else None
+                       for eid in exams}
+    
+    tutoring_sessions.update(sessions)
+    exam_results.update(exams)
+    
+    # Sets of what each profile lists, so checks stay O(1) for large histories
+    listed_sessions = {}
+    listed_exams = {}
+    for session in sessions.values():
+        profile = get_or_create_profile(session['user_id'])
+        listed = listed_sessions.setdefault(session['user_id'], set(profile['sessions']))
+        if session['session_id'] not in listed:
+            attach_session(profile, session)
+            listed.add(session['session_id'])
+    
+    for exam_id, exam_result in exams.items():
+        exam_data = exam_result['exam_data']
+        owner = tutoring_sessions.get(exam_data['session_id'])
+        if owner is None or exam_result['score'] is None:
+            continue
+        profile = get_or_create_profile(owner['user_id'])
+        listed = listed_exams.setdefault(owner['user_id'], set(profile['graded_exams']))
+        # Only a regrade if the profile already counts this exam
+        previous_score = previous_scores[exam_id] if exam_id in listed else None
+        record_exam_stats(profile, exam_id, exam_data['topic'], exam_result['score'], previous_score)
+        listed.add(exam_id)
+        bump_version(profile)
+        record_graded_answers(owner['user_id'], exam_id, exam_result)
+        heapq.heappush(newest, (exam_result['graded_at'], exam_id, owner['user_id']))
+        if len(newest) > question_index.max_items:
+            heapq.heappop(newest)  # Oldest; the index could never keep it
+    
+    counts["sessions"] += len(sessions)
+    counts["exams"] += len(exams)
+
+@api_view(['GET'])
+def export_data(request):
+    """Stream sessions, transcripts and graded exams as NDJSON"""
+    types = tuple(t for t in request.query_params.get("types", ",".join(EXPORT_TYPES)).split(",")
+                  if t in EXPORT_TYPES)
+    try:
+        since = parse_time_bound(request.query_params.get("since"), "since")
+    except PaginationError as e:
+        return Response({"error": str(e)}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    # Taken before reading so changes made during the export are picked up next time
+    cursor = export_cursor()
+    
+    response = StreamingHttpResponse(
+        iter_ndjson(iter_export_records(since, types)),
+        content_type=NDJSON_CONTENT_TYPE
+    )
+    response['X-Export-Cursor'] = cursor
+    return response
 
 @api_view(['POST'])
-def explain_concept(request):
-    """Get detailed explanation of a specific concept"""
-    global request_counter
+@parser_classes([])
+def import_data(request):
+    """Bulk import an NDJSON export, optionally gzip-encoded"""
+    stream = request.stream
+    if stream is None:
+        return Response({"error": "Request body is required"}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    if request.headers.get("Content-Encoding", "") == "gzip":
+        stream = gzip.GzipFile(fileobj=stream)
     
-    if request_counter >= MAX_REQUESTS:
-        return Response({"error": "Request limit exceeded"}, 
-                       status=status.HTTP_429_TOO_MANY_REQUESTS)
+    try:
+        counts = import_records(read_ndjson(stream))
+    except (ValueError, KeyError, TypeError, OSError) as e:
+        return Response({"error": f"Import failed: {e}"}, 
+                       status=status.HTTP_400_BAD_REQUEST)
     
-    request_counter += 1
+    return Response({"imported": counts})
+
+def get_answer_store():
+    """Return the analytics store, building it from stored exam results when needed.
+
+    NumPy and the store are only loaded by the first analytics request. On
+    shared backends other workers grade exams this store never sees, so
+    once it is older than ANALYTICS_REFRESH_SECONDS a background thread
+    adds the exams updated since its last read.
+    """
+    if answer_store is None:
+        with answer_store_refresh_lock:
+            if answer_store is None:
+                build_answer_store()
+    elif (state.shared and time.monotonic() - answer_store_refreshed_at
+          > getattr(settings, 'ANALYTICS_REFRESH_SECONDS', 60)
+          and answer_store_refresh_lock.acquire(blocking=False)):
+        threading.Thread(target=refresh_in_background, daemon=True).start()
+    return answer_store
+
+def build_answer_store():
+    """Build the analytics store from every stored exam and publish it"""
+    global answer_store, answer_store_pending, answer_store_cursor
+    from .analytics import AnswerStore
+    with answer_store_lock:
+        answer_store_pending = []
+    answer_store_cursor = None
+    store = AnswerStore()
+    refresh_answer_store(store)
+    with answer_store_lock:
+        for answers in answer_store_pending:
+            add_graded_answers(store, *answers)
+        answer_store_pending = None
+        answer_store = store
+
+def refresh_in_background():
+    """Refresh the published store, then let the next refresh start"""
+    try:
+        refresh_answer_store(answer_store)
+    finally:
+        answer_store_refresh_lock.release()
+
+def refresh_answer_store(store):
+    """Add the graded exams updated since the last read to an analytics store.
+
+    Reads the backend directly rather than through the current unit of
+    work. The read starts a little before the newest updated_at already
+    seen, to catch exams committed late by other workers; the store skips
+    gradings it already holds.
+    """
+    global answer_store_cursor, answer_store_refreshed_at
+    since = answer_store_cursor
+    if since is not None:
+        overlap = timedelta(seconds=getattr(settings, 'ANALYTICS_REFRESH_SECONDS', 60))
+        since = (datetime.fromisoformat(since) - overlap).isoformat()
+    refreshed_at = time.monotonic()
+    with state.detached():
+        updated = state.updated_since('exams', since)
+        for exam_id, exam_result in updated:
+            if exam_result.get('score') is None:
+                continue
+            owner = tutoring_sessions.get(exam_result['exam_data'].get('session_id'))
+            if owner is not None:
+                add_graded_answers(store, owner['user_id'], exam_id, exam_result)
+    newest = max((exam_result.get('updated_at', '') for _, exam_result in updated), default='')
+    if newest > (answer_store_cursor or ''):
+        answer_store_cursor = newest
+    answer_store_refreshed_at = refreshed_at
+
+def add_graded_answers(store, user_id, exam_id, exam_result):
+    """Append a graded exam's answers to an analytics store"""
+    store.append_exam(user_id, exam_id, exam_result['exam_data']['topic'],
+                      exam_result.get('detailed_results', []), exam_result['graded_at'])
+
+def record_graded_answers(user_id, exam_id, exam_result):
+    """Add a graded exam to the analytics store, if it has been built or is being built"""
+    with answer_store_lock:
+        if answer_store is not None:
+            add_graded_answers(answer_store, user_id, exam_id, exam_result)
+        elif answer_store_pending is not None:
+            answer_store_pending.append((user_id, exam_id, exam_result))
+
+def question_text(exam_id, question_id):
+    """Text of a stored exam question, or None if the exam is gone"""
+    exam_result = exam_results.get(exam_id)
+    if exam_result is None:
+        return None
+    for question in exam_result['exam_data']['questions']:
+        if question['question_id'] == question_id:
+            return question['question']
+    return None
+
+def analytics_filters(request):
+    """Read the cohort filters shared by the analytics endpoints"""
+    from .analytics import to_timestamp
+    params = request.query_params
+    users = params.get("users")
+    since = params.get("since")
+    until = params.get("until")
+    return {
+        "user_ids": [u for u in users.split(",") if u] if users else None,
+        "topic": params.get("topic") or None,
+        "since": to_timestamp(since) if since else None,
+        "until": to_timestamp(until) if until else None
+    }
+
+@api_view(['GET'])
+def analytics_topics(request):
+    """Answer volume, accuracy and average score per topic"""
+    try:
+        filters = analytics_filters(request)
+    except ValueError:
+        return Response({"error": "since/until must be ISO datetimes"}, 
+                       status=status.HTTP_400_BAD_REQUEST)
     
-    concept = request.data.get("concept", "")
-    context = request.data.get("context", "")
-    difficulty = request.data.get("difficulty", "intermediate")
-    explanation_type = request.data.get("type", "comprehensive")  # comprehensive, simple, example-based
+    return Response({"topics": get_answer_store().topic_summary(**filters)})
+
+@api_view(['GET'])
+def analytics_hardest_questions(request):
+    """Questions with the lowest accuracy"""
+    try:
+        filters = analytics_filters(request)
+        limit = min(int(request.query_params.get("limit", 10)), 100)
+        min_attempts = int(request.query_params.get("min_attempts", 1))
+    except ValueError:
+        return Response({"error": "Invalid filter or limit"}, 
+                       status=status.HTTP_400_BAD_REQUEST)
     
-    if not concept:
-        return Response({"error": "Concept is required"}, 
+    questions = get_answer_store().hardest_questions(
+        limit=max(limit, 1), min_attempts=min_attempts, **filters)
+    for question in questions:
+        question['question'] = question_text(question['exam_id'], question['question_id'])
+    return Response({"questions": questions})
+
+@api_view(['GET'])
+def analytics_scores(request):
+    """Exam score percentiles and histogram"""
+    try:
+        filters = analytics_filters(request)
+    except ValueError:
+        return Response({"error": "since/until must be ISO datetimes"}, 
                        status=status.HTTP_400_BAD_REQUEST)
     
-    explanation_prompt = f"""Explain the concept: {concept}
+    return Response(get_answer_store().score_distribution(**filters))
+
+@api_view(['GET'])
+def analytics_trend(request):
+    """Accuracy over time, bucketed by day or week"""
+    from .analytics import TREND_BUCKETS
+    bucket = request.query_params.get("bucket", "day")
+    if bucket not in TREND_BUCKETS:
+        return Response({"error": f"bucket must be one of: {', '.join(TREND_BUCKETS)}"}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    try:
+        filters = analytics_filters(request)
+    except ValueError:
+        return Response({"error": "since/until must be ISO datetimes"}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({"bucket": bucket, "trend": get_answer_store().trend(bucket, **filters)})
+
+@api_view(['GET'])
+def routing_stats(request):
+    """Observed model latencies and recent routing decisions"""
+    try:
+        recent = int(request.query_params.get("recent", 50))
+    except ValueError:
+        return Response({"error": "recent must be an integer"}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    stats = router.stats(recent=max(recent, 0))
+    stats["prompt_sizes"] = prompt_metrics.snapshot()
+    stats["prefetch"] = prefetcher.stats()
+    return Response(stats)
+
+def history_page(request, user_id, kind):
+    """Serve one cursor-paginated page of a user's sessions or graded exams"""
+    if user_id not in user_profiles:
+        return Response({"error": "User not found"}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    profile = user_profiles[user_id]
+    topic = request.query_params.get("topic")
     
-    Context: {context if context else 'General education'}
+    if kind == 'sessions':
+        ids = profile['sessions_by_topic'].get(topic, []) if topic else profile['sessions']
+        timestamp_of = lambda session_id: tutoring_sessions[session_id]['created_at']
+        serialize = session_summary
+    else:
+        ids = profile['exams_by_topic'].get(topic, []) if topic else profile['graded_exams']
+        timestamp_of = lambda exam_id: exam_results[exam_id]['graded_at']
+        serialize = exam_summary
+    
+    try:
+        page, next_cursor = paginate_by_time(
+            ids,
+            timestamp_of,
+            limit=parse_page_size(request.query_params.get("limit")),
+            cursor=request.query_params.get("cursor"),
+            since=request.query_params.get("since"),
+            until=request.query_params.get("until")
+        )
+    except PaginationError as e:
+        return Response({"error": str(e)}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        "user_id": user_id,
+        kind: [serialize(item_id) for item_id in page],
+        "next_cursor": next_cursor
+    })
+
+@api_view(['GET'])
+def list_user_sessions(request, user_id):
+    """List a user's tutoring sessions, newest first, with cursor pagination"""
+    return history_page(request, user_id, 'sessions')
+
+@api_view(['GET'])
+def list_user_exams(request, user_id):
+    """List a user's graded exams, newest first, with cursor pagination"""
+    return history_page(request, user_id, 'exams')
+
+EXPLANATION_INSTRUCTION = "You are an expert educator providing clear, structured explanations."
+DEFAULT_EXPLANATION_TYPE = "comprehensive"
+
+def session_context(session):
+    """Default explanation context for concepts asked about within a session"""
+    return f"Tutoring session on {session['topic']}"
+
+def build_explanation_prompt(concept, context, difficulty, explanation_type):
+    """Prompt for explain_concept, shared with the prefetcher so results are interchangeable"""
+    return f"""Explain the concept: {concept}
+    
+    Context: {bounded_text('explain_concept', context) if context else 'General education'}
     Difficulty Level: {difficulty}
     Explanation Type: {explanation_type}
     
@@ -607,24 +1262,58 @@ def explain_concept(request):
     
     Tailor the complexity to {difficulty} level.
     """
+
+@api_view(['POST'])
+def explain_concept(request):
+    """Get detailed explanation of a specific concept"""
+    global request_counter
+    
+    if request_counter >= MAX_REQUESTS:
+        return Response({"error": "Request limit exceeded"}, 
+                       status=status.HTTP_429_TOO_MANY_REQUESTS)
+    
+    request_counter += 1
+    
+    # With a session, context and difficulty default to the session's, which
+    # is what prefetched explanations for that session are generated with
+    session = tutoring_sessions.get(request.data.get("session_id", ""))
+    concept = request.data.get("concept", "")
+    context = request.data.get("context") or (session_context(session) if session else "")
+    difficulty = request.data.get("difficulty") or (session['difficulty_level'] if session else "intermediate")
+    explanation_type = request.data.get("type", DEFAULT_EXPLANATION_TYPE)  # comprehensive, simple, example-based
+    
+    if not concept:
+        return Response({"error": "Concept is required"}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    key = explanation_key(concept, difficulty, explanation_type, context)
+    explanation = explanation_cache.get(key)
+    if explanation is not None:
+        return Response({
+            "concept": concept,
+            "explanation": explanation,
+            "difficulty": difficulty,
+            "type": explanation_type,
+            "cached": True
+        })
     
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            config=types.GenerateContentConfig(
-                system_instruction="You are an expert educator providing clear, structured explanations.",
-                temperature=0.6
-            ),
-            contents=explanation_prompt
+        response = generate(
+            "explain_concept",
+            build_explanation_prompt(concept, context, difficulty, explanation_type),
+            EXPLANATION_INSTRUCTION,
+            difficulty=difficulty
         )
         
         explanation = response.text.strip()
+        explanation_cache.put(key, explanation)
         
         return Response({
             "concept": concept,
             "explanation": explanation,
             "difficulty": difficulty,
-            "type": explanation_type
+            "type": explanation_type,
+            "cached": False
         })
         
     except Exception as e:
@@ -644,7 +1333,12 @@ def get_exam_results(request, exam_id):
         return Response({"error": "Exam not yet graded"}, 
                        status=status.HTTP_400_BAD_REQUEST)
     
-    return Response({
+    etag = make_etag('exam', exam_id, exam_result)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    response = Response({
         "exam_id": exam_id,
         "topic": exam_result['exam_data']['topic'],
         "score": exam_result['score'],
@@ -654,6 +1348,8 @@ def get_exam_results(request, exam_id):
         "detailed_results": exam_result['detailed_results'],
         "graded_at": exam_result['graded_at']
     })
+    response['ETag'] = etag
+    return response
 
 def get_letter_grade(percentage):
     """Convert percentage to letter grade"""
@@ -688,14 +1384,7 @@ def chat(request):
     system_instruction = "You are a helpful assistant."
     
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                temperature=0.7
-            ),
-            contents=user_message
-        )
+        response = generate("chat", bounded_text('chat', user_message), system_instruction)
         
         assistant_message = response.text.strip()
         
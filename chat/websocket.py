@@ -0,0 +1,196 @@
+import asyncio
+import json
+import re
+
+from asgiref.sync import sync_to_async
+
+from . import views
+from .events import session_events
+from .prefetch import NextConceptsFilter, extract_next_concepts
+from .llm import generation_config, get_client
+from .routing import routed_call
+
+ROUTE = re.compile(r"^/ws/tutoring/(?P<session_id>[^/]+)/?$")
+MAX_PENDING_MESSAGES = 64        # Outgoing frames buffered per connection
+MAX_INCOMING_BYTES = 16 * 1024   # Largest client frame we accept
+CLOSE_NOT_FOUND = 4404
+CLOSE_SLOW_CONSUMER = 1013       # "Try again later"
+
+class TutoringConnection:
+    """One WebSocket bound to one tutoring session.
+
+    Frames to the client go through a bounded outbox drained by a single
+    writer task. Token streaming awaits space in the outbox, so a slow
+    client slows down how fast the model stream is consumed; pushed
+    events that can't fit close the connection instead of growing memory.
+    """
+
+    def __init__(self, session_id, send):
+        self.session_id = session_id
+        self._send = send
+        self._outbox = asyncio.Queue(maxsize=MAX_PENDING_MESSAGES)
+        self._loop = asyncio.get_running_loop()
+        self._turn = None
+        self.closed = False
+
+    async def emit(self, message):
+        """Queue a frame for the client, waiting while the outbox is full"""
+        await self._outbox.put(message)
+
+    def _listener(self, event):
+        # Called from whichever thread published the event
+        try:
+            self._loop.call_soon_threadsafe(self._push_event, event)
+        except RuntimeError:
+            pass  # Loop already closed
+
+    def _push_event(self, event):
+        try:
+            self._outbox.put_nowait(event)
+        except asyncio.QueueFull:
+            asyncio.ensure_future(self.close(CLOSE_SLOW_CONSUMER))
+
+    async def close(self, code=1000):
+        if not self.closed:
+            self.closed = True
+            await self._send({"type": "websocket.close", "code": code})
+
+    async def _write_loop(self):
+        while True:
+            message = await self._outbox.get()
+            if self.closed:
+                return
+            await self._send({"type": "websocket.send", "text": json.dumps(message)})
+
+    async def run(self, receive):
+        session_events.subscribe(self.session_id, self._listener)
+        writer = asyncio.ensure_future(self._write_loop())
+        try:
+            while not self.closed:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message["type"] == "websocket.receive":
+                    text = message.get("text")
+                    if text is None and message.get("bytes") is not None:
+                        text = message["bytes"].decode("utf-8", "replace")
+                    await self._handle(text or "")
+        finally:
+            self.closed = True
+            session_events.unsubscribe(self.session_id, self._listener)
+            tasks = [writer] + ([self._turn] if self._turn else [])
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _handle(self, text):
+        if len(text) > MAX_INCOMING_BYTES:
+            await self.emit({"type": "error", "error": "Message too large"})
+            return
+        try:
+            payload = json.loads(text)
+        except json.JSONDecodeError:
+            await self.emit({"type": "error", "error": "Frames must be JSON objects"})
+            return
+        if not isinstance(payload, dict):
+            await self.emit({"type": "error", "error": "Frames must be JSON objects"})
+            return
+
+        kind = payload.get("type")
+        if kind == "ping":
+            await self.emit({"type": "pong"})
+        elif kind == "message":
+            if not payload.get("content"):
+                await self.emit({"type": "error", "error": "Message is required"})
+            elif self._turn and not self._turn.done():
+                await self.emit({"type": "error", "error": "Previous message is still being answered"})
+            else:
+                self._turn = asyncio.ensure_future(self._run_turn(payload["content"]))
+        else:
+            await self.emit({"type": "error", "error": f"Unknown frame type: {kind}"})
+
+    async def _run_turn(self, user_message):
+        """Stream one tutoring reply, mirroring the tutoring_chat view"""
+        # State backends may block (SQLite), so reads and writes happen in
+        # worker threads, each step in its own unit of work
+        prepared = await sync_to_async(self._prepare_turn)(user_message)
+        if "error" in prepared:
+            await self.emit({"type": "error", "error": prepared["error"]})
+            return
+        await self._stream_reply(prepared["system_instruction"], prepared["conversation_context"])
+
+    def _prepare_turn(self, user_message):
+        """Store the student's message and build the prompt for the reply"""
+        if views.request_counter >= views.MAX_REQUESTS:
+            return {"error": "Request limit exceeded"}
+        views.request_counter += 1
+
+        with views.state.unit_of_work():
+            session = views.tutoring_sessions.get(self.session_id)
+            if session is None:
+                return {"error": "Invalid session ID"}
+            views.add_message(session, "user", user_message)
+            system_instruction, conversation_context = views.build_tutoring_prompt(session)
+        return {"system_instruction": system_instruction, "conversation_context": conversation_context}
+
+    def _finish_turn(self, reply_text):
+        """Store the model's reply and build the final frame"""
+        with views.state.unit_of_work():
+            session = views.tutoring_sessions.get(self.session_id)
+            if session is None:
+                return {"type": "error", "error": "Invalid session ID"}
+            assistant_message, next_concepts = extract_next_concepts(reply_text)
+            views.add_message(session, "assistant", assistant_message)
+            views.prefetch_explanations(session, next_concepts)
+            return {
+                "type": "reply",
+                "session_id": self.session_id,
+                "reply": assistant_message,
+                "next_concepts": next_concepts,
+                "concepts_covered": list(session['concepts_covered'])
+            }
+
+    async def _stream_reply(self, system_instruction, conversation_context):
+        parts = []
+        # The "Next concepts:" line is for the server; keep it out of the tokens
+        visible = NextConceptsFilter()
+        try:
+            with routed_call("tutoring_chat", len(conversation_context) + len(system_instruction)) as decision:
+                stream = await get_client().aio.models.generate_content_stream(
+                    model=decision.model,
+                    config=generation_config(
+                        system_instruction=system_instruction,
+                        temperature=decision.temperature
+                    ),
+                    contents=conversation_context
+                )
+
+                async for chunk in stream:
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        shown = visible.feed(chunk.text)
+                        if shown:
+                            await self.emit({"type": "token", "content": shown})
+
+            shown = visible.finish()
+            if shown:
+                await self.emit({"type": "token", "content": shown})
+            await self.emit(await sync_to_async(self._finish_turn)("".join(parts).strip()))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self.emit({"type": "error", "error": str(e)})
+
+async def tutoring_websocket(scope, receive, send):
+    """ASGI application for /ws/tutoring/<session_id>/"""
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+
+    match = ROUTE.match(scope["path"])
+    if not match or not await sync_to_async(views.tutoring_sessions.__contains__)(match["session_id"]):
+        await send({"type": "websocket.close", "code": CLOSE_NOT_FOUND})
+        return
+
+    await send({"type": "websocket.accept"})
+    await TutoringConnection(match["session_id"], send).run(receive)
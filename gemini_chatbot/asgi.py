@@ -2,6 +2,8 @@
 ASGI config for gemini_chatbot project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; WebSocket connections go to the tutoring channel in
+``chat.websocket``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gemini_chatbot.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up so the app registry is ready
+from chat.websocket import tutoring_websocket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await tutoring_websocket(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
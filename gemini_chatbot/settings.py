@@ -42,6 +42,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chat.middleware.ProfilingMiddleware',
+    'django.middleware.gzip.GZipMiddleware',
+    'chat.middleware.BrotliMiddleware',
+    'chat.middleware.TrafficRecorderMiddleware',
+    'chat.middleware.StateMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -122,3 +127,62 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Gemini client
+# The client is created lazily on first use; set to True on web workers to
+# build it in the background while the app boots.
+
+GEMINI_PREWARM_CLIENT = False
+
+# 'gemini' for the real API, 'fake' for the deterministic offline backend
+# in chat/fake_llm.py (tests, load and replay runs).
+
+GEMINI_BACKEND = 'gemini'
+
+# Per-endpoint model policy overrides, merged over chat.routing.DEFAULT_ROUTES,
+# e.g. {'chat': {'model': 'gemini-2.5-flash-lite', 'latency_budget_ms': 2000}}
+
+GEMINI_ROUTES = {}
+
+# Traffic recording for replay (see `manage.py replay_traffic`). Off by default;
+# when off the recorder middleware is removed at startup.
+
+TRAFFIC_RECORDING = False
+TRAFFIC_LOG_PATH = BASE_DIR / 'traffic_log.jsonl'
+
+# Request profiling (phase spans, cProfile and slow-request reports). Off by
+# default; when off the profiling middleware is removed at startup. Any
+# client can force profiling with PROFILING_HEADER, so set it to None where
+# that isn't wanted.
+
+PROFILING_ENABLED = False
+PROFILING_SAMPLE_RATE = 0.01
+PROFILING_HEADER = 'X-Profile'
+PROFILING_SLOW_MS = 1000
+PROFILING_REPORT_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_REPORTS = 200
+
+# Where sessions, exam results and profiles are kept: 'dict' for in-process
+# memory (a single worker only), or 'sqlite' for a WAL-mode SQLite file that
+# all workers on the host share (see chat/state.py).
+
+STATE_BACKEND = 'dict'
+STATE_SQLITE_PATH = BASE_DIR / 'state.sqlite3'
+
+# The analytics store is built from stored exam results on the first
+# analytics request. With a shared backend other workers grade exams too,
+# so once it is older than this a background thread adds the exams updated
+# since its last read.
+
+ANALYTICS_REFRESH_SECONDS = 60
+
+# Speculative explanations: after each tutoring reply, pre-generate
+# explanations for the concepts it suggests next (see chat/prefetch.py).
+# Off by default since speculation spends model calls that may go unused;
+# hit rates are reported under "prefetch" in /api/routing/stats/.
+
+PREFETCH_ENABLED = False
+PREFETCH_WORKERS = 2          # Background threads making speculative calls
+PREFETCH_MAX_PENDING = 8      # Speculative calls queued or running at once
+PREFETCH_MAX_FOREGROUND = 4   # Don't speculate while this many user-facing calls run